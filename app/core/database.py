@@ -2,11 +2,18 @@ import os
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import declarative_base
 from dotenv import load_dotenv
+from app.utils.metrics import instrument_pool
+from app.utils import sql_profile
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Statement echo is for local debugging only; use SQL_PROFILE for attribution
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
 
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+engine = create_async_engine(DATABASE_URL, echo=SQL_ECHO, future=True)
+instrument_pool(engine.sync_engine.pool)
+if sql_profile.SQL_PROFILE:
+    sql_profile.install(engine)
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 Base = declarative_base()
@@ -1,8 +1,18 @@
 import os
 import redis.asyncio as redis
+from redis.asyncio.connection import Connection
 from dotenv import load_dotenv
+from app.utils.metrics import REDIS_ROUND_TRIPS
 
 load_dotenv()
 
+
+class CountingConnection(Connection):
+    # One send per command or pipeline, i.e. per round trip
+    async def send_packed_command(self, command, check_health=True):
+        REDIS_ROUND_TRIPS.inc()
+        await super().send_packed_command(command, check_health)
+
+
 REDIS_URL = os.getenv("REDIS_URL")
-redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+redis_client = redis.from_url(REDIS_URL, decode_responses=True, connection_class=CountingConnection)
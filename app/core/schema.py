@@ -0,0 +1,20 @@
+import asyncio
+from app.core.database import engine, Base
+# Register every model on Base.metadata
+from app.models import user, chatroom, message  # noqa: F401
+
+
+async def create_schema():
+    """Create missing tables and indexes. Run once per deploy in production."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def _main():
+    await create_schema()
+    await engine.dispose()
+    print("Schema is up to date")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,7 +1,11 @@
-from fastapi import FastAPI
-from app.middleware import JWTAuthMiddleware, ErrorHandlerMiddleware
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.core.database import engine, AsyncSessionLocal, Base
+import asyncio
+import hmac
+import logging
+import os
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.middleware import JWTAuthMiddleware, ErrorHandlerMiddleware, MetricsMiddleware, SQLProfileMiddleware
+from app.core.database import engine
 from app.core.redis_client import redis_client
 
 from app.routes import auth
@@ -10,20 +14,65 @@ from app.routes import chatroom
 from app.routes import subscribe
 from app.routes import webhook
 from app.routes import subscription
+from app.routes import ws
 from app.utils import jwt
+from app.utils.replies import reply_listener
+from app.utils import passwords
+from app.utils import billing
+from app.utils import stripe_events
+from app.utils import metrics
+from app.utils import sql_profile
+from app.core.schema import create_schema
+
+# Production runs `python -m app.core.schema` once per deploy and sets this to 0
+AUTO_CREATE_SCHEMA = os.getenv("AUTO_CREATE_SCHEMA", "1") == "1"
+# Connections opened at startup so the first requests don't pay for connecting
+PREWARM_DB_CONNECTIONS = int(os.getenv("PREWARM_DB_CONNECTIONS", "0"))
+PREWARM_REDIS_CONNECTIONS = int(os.getenv("PREWARM_REDIS_CONNECTIONS", "1"))
+
+logger = logging.getLogger(__name__)
+_metrics_server = None
 
 
 app = FastAPI()
 app.add_middleware(ErrorHandlerMiddleware)
 app.add_middleware(JWTAuthMiddleware)
+# Outermost, so its timing includes auth
+app.add_middleware(MetricsMiddleware)
+if sql_profile.SQL_PROFILE:
+    app.add_middleware(SQLProfileMiddleware)
 
 @app.on_event("startup")
 async def startup():
+    global _metrics_server
     # Create tables if not exist
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    # Test Redis connection
-    await redis_client.ping()
+    if AUTO_CREATE_SCHEMA:
+        await create_schema()
+    if PREWARM_DB_CONNECTIONS:
+        conns = await asyncio.gather(*(engine.connect() for _ in range(PREWARM_DB_CONNECTIONS)))
+        for conn in conns:
+            await conn.close()
+    # Test Redis connection (concurrent pings open that many pooled connections)
+    await asyncio.gather(*(redis_client.ping() for _ in range(max(1, PREWARM_REDIS_CONNECTIONS))))
+    # Applies Stripe webhook events queued by /webhook/stripe
+    if stripe_events.STRIPE_EVENT_CONSUMER:
+        stripe_events.consumer.start()
+    if metrics.METRICS_PORT:
+        try:
+            _metrics_server = await metrics.serve_metrics(metrics.METRICS_PORT)
+        except OSError as exc:
+            # e.g. another API worker process already serves this port
+            logger.warning("Not serving metrics on port %d: %s", metrics.METRICS_PORT, exc)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await reply_listener.stop()
+    await stripe_events.consumer.stop()
+    await billing.aclose()
+    passwords.shutdown()
+    if _metrics_server is not None:
+        _metrics_server.close()
 
 
 @app.get("/")
@@ -31,6 +80,15 @@ async def root():
     return {"message": "Gemini-style backend API"}
 
 
+if metrics.METRICS_TOKEN:
+    @app.get("/metrics", include_in_schema=False)
+    async def get_metrics(authorization: str = Header(None)):
+        if not hmac.compare_digest(authorization or "", f"Bearer {metrics.METRICS_TOKEN}"):
+            return JSONResponse(status_code=401, content={"success": False, "message": "Unauthorized"})
+        # Prometheus text exposition format
+        return PlainTextResponse(await metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 # Routers
 app.include_router(auth.router)
 app.include_router(user.router)
@@ -38,3 +96,4 @@ app.include_router(chatroom.router)
 app.include_router(subscribe.router)
 app.include_router(webhook.router)
 app.include_router(subscription.router)
+app.include_router(ws.router)
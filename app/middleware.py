@@ -1,7 +1,9 @@
-from fastapi import Request, Response
+import re
+import time
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
 from app.utils.jwt import verify_access_token
+from app.utils.metrics import HTTP_REQUEST_DURATION, METRICS_TOKEN
+from app.utils.sql_profile import start_profile, end_profile
 import logging
 
 
@@ -13,35 +15,136 @@ PUBLIC_PATHS = [
     ("/docs", None),
     ("/openapi", None),
 ]
+if METRICS_TOKEN:
+    # Checked against METRICS_TOKEN by the route itself, not as a JWT
+    PUBLIC_PATHS.append(("/metrics", "GET"))
 
 
-class JWTAuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        
-        for path, method in PUBLIC_PATHS:
-            if request.url.path.startswith(path) and (method is None or request.method == method):
-                return await call_next(request)
-        auth_header = request.headers.get("authorization",None)
-        print("Authorization Header:")
+def _compile_public_paths(paths):
+    """Build one prefix regex per HTTP method (plus one for other methods)."""
+    def pattern(method):
+        prefixes = sorted((p for p, m in paths if m is None or m == method), key=len, reverse=True)
+        return re.compile("|".join(map(re.escape, prefixes))) if prefixes else None
+    methods = {m for _, m in paths if m is not None}
+    return {m: pattern(m) for m in methods}, pattern(None)
+
+
+_PUBLIC_BY_METHOD, _PUBLIC_ANY_METHOD = _compile_public_paths(PUBLIC_PATHS)
+
+
+def is_public_path(path: str, method: str) -> bool:
+    pattern = _PUBLIC_BY_METHOD.get(method, _PUBLIC_ANY_METHOD)
+    return pattern is not None and pattern.match(path) is not None
+
+
+def _get_header(scope, name: bytes):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class JWTAuthMiddleware:
+    # Plain ASGI middleware: no per-request task or body stream wrapping
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or is_public_path(scope["path"], scope["method"]):
+            return await self.app(scope, receive, send)
+        auth_header = _get_header(scope, b"authorization")
         if not auth_header or not auth_header.lower().startswith("bearer "):
-            return JSONResponse(status_code=401, content={"success": False, "message": "Missing or invalid Authorization header"})
+            response = JSONResponse(status_code=401, content={"success": False, "message": "Missing or invalid Authorization header"})
+            return await response(scope, receive, send)
         parts = auth_header.split(" ", 1)
         if len(parts) != 2 or not parts[1].strip():
-            return JSONResponse(status_code=401, content={"success": False, "message": "Malformed Authorization header"})
+            response = JSONResponse(status_code=401, content={"success": False, "message": "Malformed Authorization header"})
+            return await response(scope, receive, send)
         token = parts[1].strip()
         payload = verify_access_token(token)
         if not payload or "sub" not in payload:
-            return JSONResponse(status_code=401, content={"success": False, "message": "Invalid or expired token"})
+            response = JSONResponse(status_code=401, content={"success": False, "message": "Invalid or expired token"})
+            return await response(scope, receive, send)
         # Attach user info to request.state for downstream use
-        request.state.user_mobile = payload["sub"]
-        return await call_next(request)
+        scope.setdefault("state", {})["user_mobile"] = payload["sub"]
+        await self.app(scope, receive, send)
+
+class ErrorHandlerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        response_started = False
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
 
-class ErrorHandlerMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
         try:
-            response = await call_next(request)
-            return response
+            await self.app(scope, receive, send_wrapper)
         except Exception as exc:
             logging.error(f"Unhandled error: {exc}", exc_info=True)
+            if response_started:
+                # Too late to replace the response
+                raise
             # In production, return a generic message
-            return JSONResponse(status_code=500, content={"success": False, "message": "Internal server error"})
+            response = JSONResponse(status_code=500, content={"success": False, "message": "Internal server error"})
+            await response(scope, receive, send)
+
+
+class MetricsMiddleware:
+    """Records request latency per route template (not per raw path, to bound cardinality)."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start, scope["method"], getattr(route, "path", "unmatched"), status
+            )
+
+
+class SQLProfileMiddleware:
+    """Per-request statement count and DB time, as X-DB-* response headers and a log line."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profile, token = start_profile(f'{scope["method"]} {scope["path"]}')
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(profile.count).encode()))
+                headers.append((b"x-db-time-ms", f"{profile.seconds * 1000:.1f}".encode()))
+                repeated = profile.repeated()
+                if repeated:
+                    headers.append((b"x-db-repeated", str(len(repeated)).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end_profile(token)
+            profile.log()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, func
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
@@ -8,6 +9,13 @@ class Message(Base):
     chatroom_id = Column(Integer, ForeignKey("chatrooms.id"), nullable=False)
     sender = Column(String(20), nullable=False)  # 'user' or 'ai'
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=func.now())
+    # Set in Python so stored values and keyset cursors share one representation
+    # (SQLite's CURRENT_TIMESTAMP has no fraction, bound datetimes do)
+    created_at = Column(DateTime, default=datetime.utcnow)
     # Relationship to chatroom (optional)
     chatroom = relationship("Chatroom", backref="messages")
+
+    # Serves "latest N messages of a chatroom" and keyset pages over (created_at, id)
+    __table_args__ = (
+        Index("ix_messages_chatroom_created_id", "chatroom_id", "created_at", "id"),
+    )
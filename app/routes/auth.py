@@ -5,19 +5,19 @@ from app.models.user import User
 from fastapi import HTTPException, status
 from app.schemas import UserSignup, OTPRequest, OTPVerify, ChangePassword
 from app.utils.jwt import create_access_token, verify_access_token
-from app.utils.user import get_current_user
+from app.utils.user import get_current_user, invalidate_user
 from app.utils.otp import generate_otp
 from app.core.redis_client import redis_client
-from passlib.context import CryptContext
+from app.utils.passwords import hash_password, verify_password
+from app.utils.mobile import is_registered, mark_registered
 
 from fastapi.responses import JSONResponse
 from fastapi import Header, Request
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 
 
 router = APIRouter(prefix='/auth', tags=["auth"])
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 
@@ -27,30 +27,25 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 @router.post("/signup", response_class=JSONResponse)
 async def signup(user: UserSignup, db: AsyncSession = Depends(get_db)):
-    # Check if user already exists
-    result = await db.execute(
-        User.__table__.select().where(User.mobile == user.mobile)
-    )
-    existing = result.first()
-    if existing:
+    # Check if user already exists (string against the string column, so the unique index is used)
+    result = await db.execute(select(User.id).where(User.mobile == user.mobile))
+    if result.first():
+        await mark_registered(user.mobile)
         return JSONResponse(status_code=409, content={"success": False, "message": "User already exists"})
     # Hash password and create new user
-    password_hash = pwd_context.hash(user.password) if user.password else None
+    password_hash = await hash_password(user.password) if user.password else None
     new_user = User(mobile=user.mobile, name=user.name, password_hash=password_hash)
     db.add(new_user)
     await db.commit()
     await db.refresh(new_user)
+    await mark_registered(new_user.mobile)
     return JSONResponse(status_code=201, content={"success": True, "id": new_user.id, "mobile": new_user.mobile, "name": new_user.name})
 
 
 @router.post("/send-otp", response_class=JSONResponse)
 async def send_otp(data: OTPRequest, db: AsyncSession = Depends(get_db)):
-    # Check if user exists
-    result = await db.execute(
-        User.__table__.select().where(User.mobile == data.mobile)
-    )
-    user = result.first()
-    if not user:
+    # Check if user exists; unknown numbers are answered from Redis
+    if not await is_registered(data.mobile, db):
         return JSONResponse(status_code=404, content={"success": False, "message": "Mobile number not registered"})
     # Generate OTP and store in Redis for login/verification
     otp = generate_otp()
@@ -75,12 +70,8 @@ async def verify_otp(data: OTPVerify):
 
 @router.post("/forgot-password", response_class=JSONResponse)
 async def forgot_password(data: OTPRequest, db: AsyncSession = Depends(get_db)):
-    # Check if user exists
-    result = await db.execute(
-        User.__table__.select().where(User.mobile == data.mobile)
-    )
-    user = result.first()
-    if not user:
+    # Check if user exists; unknown numbers are answered from Redis
+    if not await is_registered(data.mobile, db):
         return JSONResponse(status_code=404, content={"success": False, "message": "Mobile number not registered"})
     # Generate OTP and store in Redis for password reset
     otp = generate_otp()
@@ -96,10 +87,17 @@ async def change_password(data: ChangePassword, current_user: User = Depends(get
         return JSONResponse(status_code=401, content={"success": False, "message": "Unauthorized"})
     # If old_password is provided, check it
     if data.old_password:
-        if not current_user.password_hash or not pwd_context.verify(data.old_password, current_user.password_hash):
+        result = await db.execute(select(User.password_hash).where(User.id == current_user.id))
+        password_hash = result.scalar()
+        valid = False
+        if password_hash:
+            valid = await verify_password(data.old_password, password_hash)
+        if not valid:
             return JSONResponse(status_code=400, content={"success": False, "message": "Old password is incorrect"})
     # Update password
-    current_user.password_hash = pwd_context.hash(data.new_password)
-    db.add(current_user)
+    await db.execute(
+        update(User).where(User.id == current_user.id).values(password_hash=await hash_password(data.new_password))
+    )
     await db.commit()
+    await invalidate_user(current_user.mobile)
     return JSONResponse(status_code=200, content={"success": True, "message": "Password changed successfully"})
\ No newline at end of file
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Request, Query, Header
 from sqlalchemy.ext.asyncio import AsyncSession
  
 from app.models.chatroom import Chatroom
@@ -7,19 +7,37 @@ from app.schemas import ChatroomCreate
 from app.schemas_chatroom import ChatroomOut
 from app.core.redis_client import redis_client
 import json
-from fastapi.responses import JSONResponse
+import os
+from fastapi.responses import JSONResponse, StreamingResponse
 from app.models.message import Message
-from app.utils.queue import enqueue_gemini_task
+from app.utils.queue import over_slo, Overloaded
+from app.utils.replies import wait_for_reply
+from app.utils.messages import save_and_enqueue
+from app.utils.streams import relay_events, format_sse
+from app.utils.pagination import encode_cursor, decode_cursor, messages_before
+from app.utils.cache import TTLCache, SingleFlight
+from app.utils.quota import reserve_message, limit_message
+from app.utils import idempotency
+from app.core.database import AsyncSessionLocal
 from app.models.user import User
 from app.schemas import MessageCreate
 from sqlalchemy import select
-from datetime import datetime
 
 router = APIRouter(prefix="/chatroom", tags=["chatroom"])
 
+CHATROOM_LIST_TTL = 300
+# Optional per-process cache of chatroom lists, keyed by version (0 disables it)
+CHATROOM_NEAR_CACHE_TTL = float(os.getenv("CHATROOM_NEAR_CACHE_TTL", "0"))
+_chatroom_lists = TTLCache(maxsize=10000 if CHATROOM_NEAR_CACHE_TTL > 0 else 0, ttl=CHATROOM_NEAR_CACHE_TTL)
+_chatroom_flights = SingleFlight()
+
 from app.utils.db import get_db
 
 
+def _chatroom_version_key(user_id: int) -> str:
+    return f"chatrooms:ver:{user_id}"
+
+
 @router.post("/", response_class=JSONResponse)
 async def create_chatroom(data: ChatroomCreate, current_user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     # Require authentication
@@ -30,32 +48,47 @@ async def create_chatroom(data: ChatroomCreate, current_user=Depends(get_current
     db.add(chatroom)
     await db.commit()
     await db.refresh(chatroom)
+    # New version: cached lists of this user are no longer read
+    await redis_client.incr(_chatroom_version_key(current_user.id))
     return JSONResponse(status_code=201, content={"success": True, "chatroom_id": chatroom.id, "name": chatroom.name})
 
 
 @router.get("/", response_class=JSONResponse)
-async def list_chatrooms(current_user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def list_chatrooms(current_user=Depends(get_current_user)):
     # Require authentication
     if not current_user:
         return JSONResponse(status_code=401, content={"success": False, "message": "Unauthorized"})
-    cache_key = f"chatrooms:{current_user.id}"
-    cached = await redis_client.get(cache_key)
-    if cached:
-        chatrooms = json.loads(cached)
+    # The version is read before the DB so a list loaded concurrently with a
+    # create is stored under the old version and never served
+    version = await redis_client.get(_chatroom_version_key(current_user.id)) or "0"
+    cache_key = f"chatrooms:{current_user.id}:v{version}"
+    chatrooms = _chatroom_lists.get(cache_key)
+    if chatrooms is None:
+        cached = await redis_client.get(cache_key)
+        if cached:
+            chatrooms = json.loads(cached)
+            _chatroom_lists.set(cache_key, chatrooms)
+    if chatrooms is not None:
         return JSONResponse(status_code=200, content={"success": True, "chatrooms": chatrooms, "cached": True})
-    # Not cached, fetch from DB
-    from sqlalchemy import select
-    result = await db.execute(
-        select(Chatroom).where(Chatroom.user_id == current_user.id)
-    )
-    chatrooms = [
-        {"id": row.id, "name": row.name, "created_at": row.created_at.isoformat()} for row in result.scalars().all()
-    ]
-    # Cache for 5 minutes
-    await redis_client.setex(cache_key, 300, json.dumps(chatrooms))
+    # Not cached: one DB query per key, however many requests miss at once
+    chatrooms = await _chatroom_flights.do(cache_key, lambda: _load_chatrooms(current_user.id, cache_key))
     return JSONResponse(status_code=200, content={"success": True, "chatrooms": chatrooms})
 
 
+async def _load_chatrooms(user_id: int, cache_key: str):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Chatroom.id, Chatroom.name, Chatroom.created_at).where(Chatroom.user_id == user_id)
+        )
+        chatrooms = [
+            {"id": row.id, "name": row.name, "created_at": row.created_at.isoformat()} for row in result
+        ]
+    # Cache for 5 minutes
+    await redis_client.setex(cache_key, CHATROOM_LIST_TTL, json.dumps(chatrooms))
+    _chatroom_lists.set(cache_key, chatrooms)
+    return chatrooms
+
+
 @router.get("/{chatroom_id}", response_class=JSONResponse)
 async def get_chatroom(chatroom_id: int, current_user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     # Require authentication
@@ -81,55 +114,128 @@ async def get_chatroom(chatroom_id: int, current_user=Depends(get_current_user),
     })
 
 
+@router.get("/{chatroom_id}/messages", response_class=JSONResponse)
+async def list_messages(chatroom_id: int, before: str = None, limit: int = Query(50, ge=1, le=100), current_user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    # Require authentication
+    if not current_user:
+        return JSONResponse(status_code=401, content={"success": False, "message": "Unauthorized"})
+    result = await db.execute(
+        select(Chatroom.id).where((Chatroom.id == chatroom_id) & (Chatroom.user_id == current_user.id))
+    )
+    if result.first() is None:
+        return JSONResponse(status_code=404, content={"success": False, "message": "Chatroom not found"})
+    # Newest first; every page is one index range scan, however deep (no OFFSET)
+    query = select(Message.id, Message.sender, Message.content, Message.created_at).where(Message.chatroom_id == chatroom_id)
+    if before:
+        try:
+            query = query.where(messages_before(*decode_cursor(before)))
+        except ValueError:
+            return JSONResponse(status_code=400, content={"success": False, "message": "Invalid cursor"})
+    query = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    messages = [
+        {"id": row.id, "sender": row.sender, "content": row.content, "created_at": row.created_at.isoformat()}
+        for row in rows[:limit]
+    ]
+    return JSONResponse(status_code=200, content={"success": True, "messages": messages, "next_cursor": next_cursor})
+
+
 @router.post("/{chatroom_id}/message", response_class=JSONResponse)
-async def post_message(chatroom_id: int, data: MessageCreate, current_user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def post_message(chatroom_id: int, data: MessageCreate, idempotency_key: str = Header(None), current_user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    # Require authentication
+    if not current_user:
+        return JSONResponse(status_code=401, content={"success": False, "message": "Unauthorized"})
+    # A retry with the same Idempotency-Key reuses the original request's result
+    if idempotency_key:
+        request_fingerprint = idempotency.fingerprint(chatroom_id, data.content)
+        record = await idempotency.begin(current_user.id, idempotency_key, request_fingerprint)
+        if record is not None:
+            if record.get("fingerprint") != request_fingerprint:
+                return JSONResponse(status_code=422, content={"success": False, "message": "This Idempotency-Key was already used for a different request"})
+            return await _replay_message(current_user.id, idempotency_key, record)
+    try:
+        # Reserve quota before touching the DB or the queue; refunded if the LLM call fails
+        reservation = await reserve_message(current_user)
+        if reservation is None:
+            response = JSONResponse(status_code=429, content={"success": False, "message": limit_message(current_user)})
+        else:
+            message, queue_wait = await save_and_enqueue(db, chatroom_id, current_user, data.content, reservation, idempotency_key=idempotency_key)
+            if message is None:
+                response = JSONResponse(status_code=404, content={"success": False, "message": "Chatroom not found"})
+    except Overloaded as exc:
+        reservation = message = None
+        response = _overloaded_response(exc)
+    except Exception:
+        if idempotency_key:
+            await idempotency.release(current_user.id, idempotency_key)
+        raise
+    if reservation is None or message is None:
+        # Rejected: let the client retry with the same key
+        if idempotency_key:
+            await idempotency.release(current_user.id, idempotency_key)
+        return response
+    if idempotency_key:
+        await idempotency.attach(current_user.id, idempotency_key, message.id)
+    # Behind a backlog the reply won't come in time: answer 202 at once
+    if over_slo(current_user.subscription.lower(), queue_wait):
+        return await _message_response(current_user.id, idempotency_key, message.id, None)
+    # Wait for the worker to publish the Gemini response
+    reply = await wait_for_reply(message.id, timeout=20)
+    return await _message_response(current_user.id, idempotency_key, message.id, reply)
+
+
+async def _replay_message(user_id: int, idempotency_key: str, record: dict):
+    if record["state"] == "done":
+        return JSONResponse(status_code=record["status"], content=record["body"])
+    record = await idempotency.wait_for_message_id(user_id, idempotency_key, record)
+    if record is None:
+        return JSONResponse(status_code=409, content={"success": False, "message": "The original request failed. Retry with a new Idempotency-Key."})
+    if record["state"] == "done":
+        return JSONResponse(status_code=record["status"], content=record["body"])
+    if "message_id" not in record:
+        return JSONResponse(status_code=409, content={"success": False, "message": "A request with this Idempotency-Key is still in progress"})
+    # Attach to the original request's pending reply
+    reply = await wait_for_reply(record["message_id"], timeout=20)
+    return await _message_response(user_id, idempotency_key, record["message_id"], reply)
+
+
+async def _message_response(user_id: int, idempotency_key: str, message_id: int, reply: dict):
+    if reply is None:
+        # The key stays pending until the worker completes it, so a later retry
+        # attaches to the same reply
+        return JSONResponse(status_code=202, content={"success": True, "message_id": message_id, "status": "queued", "ai_message": None, "info": "AI response not ready yet. Try again soon."})
+    body = idempotency.reply_body(message_id, reply["content"])
+    # The worker completes the record too; whichever is first, the body is the same
+    if idempotency_key:
+        await idempotency.complete(user_id, idempotency_key, 200, body)
+    return JSONResponse(status_code=200, content=body)
+
+
+@router.post("/{chatroom_id}/message/stream")
+async def post_message_stream(chatroom_id: int, data: MessageCreate, current_user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     # Require authentication
     if not current_user:
         return JSONResponse(status_code=401, content={"success": False, "message": "Unauthorized"})
-    # Get chatroom by chatroom_id and user
-    result = await db.execute(select(Chatroom).where((Chatroom.id == chatroom_id) & (Chatroom.user_id == current_user.id)))
-    chatroom = result.scalars().first()
-    if not chatroom:
+    reservation = await reserve_message(current_user)
+    if reservation is None:
+        return JSONResponse(status_code=429, content={"success": False, "message": limit_message(current_user)})
+    try:
+        message, _ = await save_and_enqueue(db, chatroom_id, current_user, data.content, reservation, stream=True)
+    except Overloaded as exc:
+        return _overloaded_response(exc)
+    if message is None:
         return JSONResponse(status_code=404, content={"success": False, "message": "Chatroom not found"})
-    user = current_user
-    # Save user message to DB
-    message = Message(chatroom_id=chatroom.id, sender="user", content=data.content)
-    db.add(message)
-    await db.commit()
-    await db.refresh(message)
-    # Enqueue Gemini API task
-    await enqueue_gemini_task(chatroom.id, user.id, message.id, data.content)
-    # Wait for Gemini response (poll for new AI message)
-    from asyncio import sleep
-    ai_message = None
-    for _ in range(40):  # Wait up to ~20 seconds (40 x 0.5s)
-        async for poll_db in get_db():
-            result = await poll_db.execute(
-                select(Message).where(
-                    (Message.chatroom_id == chatroom.id) & (Message.sender == "ai")
-                ).order_by(Message.created_at.desc())
-            )
-            ai_message = result.scalars().first()
-            if ai_message and ai_message.created_at > message.created_at:
-                break
-        if ai_message and ai_message.created_at > message.created_at:
-            break
-        await sleep(0.5)
-    # Only increment usage if Gemini response is valid
-    if ai_message and ai_message.created_at > message.created_at and ai_message.content and not ai_message.content.startswith("[Gemini API error"):
-        if current_user.subscription.lower() == "basic":
-            today = datetime.utcnow().strftime("%Y-%m-%d")
-            redis_key = f"usage:{user.id}:{today}"
-            usage = await redis_client.get(redis_key)
-            usage = int(usage) if usage else 0
-            if usage >= 5:
-                return JSONResponse(status_code=429, content={"success": False, "message": "Daily message limit reached for Basic plan. Upgrade to Pro for more usage."})
-            await redis_client.incr(redis_key)
-            await redis_client.expire(redis_key, 86400)  # 1 day
-    if not ai_message or ai_message.created_at <= message.created_at:
-        return JSONResponse(status_code=202, content={"success": True, "message_id": message.id, "status": "queued", "ai_message": None, "info": "AI response not ready yet. Try again soon."})
-    return JSONResponse(status_code=200, content={
-        "success": True,
-        "message_id": message.id,
-        "ai_message": ai_message.content
-    })
+
+    async def events():
+        yield format_sse("queued", {"message_id": message.id})
+        async for event, payload in relay_events(message.id, timeout=20):
+            yield format_sse(event, payload)
+
+    # Tokens are sent as Server-Sent Events as the worker relays them
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _overloaded_response(exc: Overloaded):
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, content={"success": False, "message": str(exc)}, headers=headers)
@@ -1,11 +1,21 @@
+import json
+import os
 from fastapi import APIRouter, Depends, Request
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession 
+from app.core.database import AsyncSessionLocal
 from app.models.user import User
+from app.models.chatroom import Chatroom
+from app.models.message import Message
 from app.utils.user import get_current_user
-from fastapi.responses import JSONResponse
+from app.utils.pagination import messages_after
+from fastapi.responses import JSONResponse, StreamingResponse
 
 router = APIRouter(prefix="/user", tags=["user"])
 
+# Rows read (and written to the response) per query during an export
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
 from app.utils.db import get_db
 
 @router.get("/me", response_class=JSONResponse)
@@ -20,3 +30,61 @@ async def get_me(request: Request,current_user: User = Depends(get_current_user)
         "plan": current_user.subscription.lower(),
         "mobile": current_user.mobile, 
     })
+
+
+@router.get("/me/export")
+async def export_me(current_user: User = Depends(get_current_user)):
+    if not current_user:
+        return JSONResponse(status_code=401, content={"success": False, "message": "Unauthorized"})
+    # One JSON object per line: each chatroom followed by its messages, oldest first
+    return StreamingResponse(
+        _export_lines(current_user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="export.ndjson"'},
+    )
+
+
+async def _export_lines(user_id: int):
+    chatrooms = messages = 0
+    last_chatroom_id = 0
+    while True:
+        rooms = await _read_chunk(
+            select(Chatroom.id, Chatroom.name, Chatroom.created_at)
+            .where((Chatroom.user_id == user_id) & (Chatroom.id > last_chatroom_id))
+            .order_by(Chatroom.id)
+        )
+        if not rooms:
+            break
+        for room in rooms:
+            chatrooms += 1
+            yield _ndjson([{"type": "chatroom", "id": room.id, "name": room.name, "created_at": _iso(room.created_at)}])
+            cursor = None
+            while True:
+                query = select(Message.id, Message.sender, Message.content, Message.created_at).where(Message.chatroom_id == room.id)
+                if cursor:
+                    query = query.where(messages_after(*cursor))
+                rows = await _read_chunk(query.order_by(Message.created_at, Message.id))
+                if not rows:
+                    break
+                messages += len(rows)
+                yield _ndjson({
+                    "type": "message", "chatroom_id": room.id, "id": row.id, "sender": row.sender,
+                    "content": row.content, "created_at": _iso(row.created_at),
+                } for row in rows)
+                cursor = (rows[-1].created_at, rows[-1].id)
+        last_chatroom_id = rooms[-1].id
+    yield _ndjson([{"type": "end", "chatrooms": chatrooms, "messages": messages}])
+
+
+async def _read_chunk(query):
+    # A session per chunk: the pooled connection isn't held while a slow client reads
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(query.limit(EXPORT_CHUNK_SIZE))).all()
+
+
+def _ndjson(objs) -> str:
+    return "".join(json.dumps(obj) + "\n" for obj in objs)
+
+
+def _iso(value):
+    return value.isoformat() if value else None
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import select
+from app.core.database import AsyncSessionLocal
+from app.models.chatroom import Chatroom
+from app.utils.jwt import verify_access_token
+from app.utils.messages import save_and_enqueue
+from app.utils.quota import reserve_message, limit_message
+from app.utils.queue import Overloaded
+from app.utils.replies import reply_listener
+from app.utils.user import load_user
+
+router = APIRouter(tags=["ws"])
+
+# Seconds a client has to send {"type": "auth"} when no ?token= was given
+AUTH_TIMEOUT = 10.0
+
+logger = logging.getLogger(__name__)
+
+
+class _Connection:
+    """One authenticated socket: its subscribed chatrooms and reply pusher."""
+
+    def __init__(self, websocket: WebSocket, mobile: str, user_id: int):
+        self.websocket = websocket
+        self.mobile = mobile
+        self.user_id = user_id
+        self.rooms: set[int] = set()
+        self.replies: asyncio.Queue = asyncio.Queue()
+        # Replies are pushed while the receive loop may be answering a command
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, frame: dict):
+        async with self._send_lock:
+            await self.websocket.send_json(frame)
+
+    async def push_replies(self):
+        while True:
+            reply = await self.replies.get()
+            await self.send({
+                "type": "reply",
+                "chatroom_id": reply["chatroom_id"],
+                "message_id": reply["message_id"],
+                "ai_message": reply["content"],
+            })
+
+    async def subscribe(self, chatroom_ids: list[int]):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Chatroom.id).where((Chatroom.user_id == self.user_id) & Chatroom.id.in_(chatroom_ids))
+            )
+            owned = {row[0] for row in result}
+        for chatroom_id in owned - self.rooms:
+            await reply_listener.subscribe_room(chatroom_id, self.replies)
+        self.rooms |= owned
+        await self.send({
+            "type": "subscribed",
+            "chatroom_ids": sorted(owned),
+            "not_found": sorted(set(chatroom_ids) - owned),
+        })
+
+    def unsubscribe(self, chatroom_ids: list[int]):
+        for chatroom_id in set(chatroom_ids) & self.rooms:
+            reply_listener.unsubscribe_room(chatroom_id, self.replies)
+            self.rooms.discard(chatroom_id)
+
+    def close(self):
+        self.unsubscribe(list(self.rooms))
+
+    async def post_message(self, chatroom_id: int, content: str, ref=None):
+        async with AsyncSessionLocal() as db:
+            # Reloaded per message (near-cached) so plan changes apply to open sockets
+            user = await load_user(self.mobile, db)
+            if user is None:
+                return await self.send({"type": "error", "ref": ref, "message": "Unauthorized"})
+            reservation = await reserve_message(user)
+            if reservation is None:
+                return await self.send({"type": "error", "ref": ref, "message": limit_message(user)})
+            # Subscribe before enqueueing so the reply can't be published first
+            new_room = chatroom_id not in self.rooms
+            if new_room:
+                await reply_listener.subscribe_room(chatroom_id, self.replies)
+            try:
+                message, _ = await save_and_enqueue(db, chatroom_id, user, content, reservation)
+            except Overloaded as exc:
+                message = None
+                error = str(exc)
+            except Exception:
+                if new_room:
+                    reply_listener.unsubscribe_room(chatroom_id, self.replies)
+                raise
+            else:
+                error = "Chatroom not found"
+        if message is None:
+            if new_room:
+                reply_listener.unsubscribe_room(chatroom_id, self.replies)
+            return await self.send({"type": "error", "ref": ref, "message": error})
+        self.rooms.add(chatroom_id)
+        await self.send({"type": "queued", "ref": ref, "chatroom_id": chatroom_id, "message_id": message.id})
+
+
+async def _authenticate(websocket: WebSocket, token: str):
+    if token is None:
+        # No token in the URL: the first frame must be {"type": "auth", "token": ...}
+        try:
+            frame = json.loads(await asyncio.wait_for(websocket.receive_text(), AUTH_TIMEOUT))
+        except (asyncio.TimeoutError, ValueError):
+            return None
+        if not isinstance(frame, dict) or frame.get("type") != "auth":
+            return None
+        token = frame.get("token")
+    payload = verify_access_token(token) if isinstance(token, str) else None
+    if not payload or "sub" not in payload:
+        return None
+    async with AsyncSessionLocal() as db:
+        return await load_user(payload["sub"], db)
+
+
+def _ids(value) -> list[int]:
+    if not isinstance(value, list) or not all(isinstance(v, int) for v in value):
+        raise ValueError("chatroom_ids must be a list of integers")
+    return value
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket, token: str = None):
+    """
+    One socket per client for all of its chatrooms. Client frames:
+    {"type": "subscribe" | "unsubscribe", "chatroom_ids": [...]} and
+    {"type": "message", "chatroom_id": ..., "content": ..., "ref": ...}.
+    AI replies of subscribed chatrooms arrive as {"type": "reply", ...}.
+    """
+    await websocket.accept()
+    user = await _authenticate(websocket, token)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    conn = _Connection(websocket, user.mobile, user.id)
+    pusher = asyncio.create_task(conn.push_replies())
+    try:
+        await conn.send({"type": "ready", "user_id": user.id})
+        while True:
+            ref = None
+            try:
+                frame = json.loads(await websocket.receive_text())
+                kind = frame.get("type")
+                ref = frame.get("ref")
+                if kind == "subscribe":
+                    await conn.subscribe(_ids(frame.get("chatroom_ids")))
+                elif kind == "unsubscribe":
+                    conn.unsubscribe(_ids(frame.get("chatroom_ids")))
+                    await conn.send({"type": "unsubscribed", "chatroom_ids": frame["chatroom_ids"]})
+                elif kind == "message":
+                    chatroom_id, content = frame.get("chatroom_id"), frame.get("content")
+                    if not isinstance(chatroom_id, int) or not isinstance(content, str) or not content.strip():
+                        raise ValueError("message needs an integer chatroom_id and non-empty content")
+                    await conn.post_message(chatroom_id, content, ref)
+                else:
+                    raise ValueError(f"Unknown frame type: {kind!r}")
+            except (ValueError, AttributeError) as exc:
+                await conn.send({"type": "error", "ref": ref, "message": str(exc)})
+            except WebSocketDisconnect:
+                raise
+            except Exception:
+                # A failing command (DB or Redis error) is reported; the socket
+                # and its other chatrooms stay up
+                logger.exception("WebSocket command failed for user %s", user.id)
+                await conn.send({"type": "error", "ref": ref, "message": "Internal server error"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        pusher.cancel()
+        conn.close()
@@ -1,16 +1,23 @@
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
+from app.utils.mobile import canonical_mobile
 
-class UserSignup(BaseModel):
-    mobile: int = Field(..., gt=0)
+class MobileModel(BaseModel):
+    # Accepts numbers or strings ("+1 555-0100"); always a canonical digit string after validation
+    mobile: str
+
+    @validator("mobile", pre=True)
+    def _canonical_mobile(cls, value):
+        return canonical_mobile(value)
+
+class UserSignup(MobileModel):
     name: str = Field(..., min_length=1)
     password: str = Field(..., min_length=6)
 
-class OTPRequest(BaseModel):
-    mobile: int = Field(..., gt=0)
+class OTPRequest(MobileModel):
+    pass
 
-class OTPVerify(BaseModel):
-    mobile: int = Field(..., gt=0)
+class OTPVerify(MobileModel):
     otp: str = Field(..., min_length=4)
 
 class ChangePassword(BaseModel):
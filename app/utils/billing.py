@@ -0,0 +1,84 @@
+import os
+import httpx
+
+# stripe is imported on first use, so pods that never touch billing don't pay
+# for importing it at startup. Only webhook signature checks (no network) use
+# the SDK; API calls go through the async client below so they never block the
+# event loop.
+_stripe = None
+
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")
+STRIPE_TIMEOUT = float(os.getenv("STRIPE_TIMEOUT", "10"))
+STRIPE_MAX_CONNECTIONS = int(os.getenv("STRIPE_MAX_CONNECTIONS", "20"))
+
+_client = None
+
+
+class StripeError(Exception):
+    """A Stripe API call failed; `status` is None for network errors."""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+def get_stripe():
+    global _stripe
+    if _stripe is None:
+        import stripe
+        stripe.api_key = os.getenv("STRIPE_API_KEY")
+        _stripe = stripe
+    return _stripe
+
+
+def _get_client() -> httpx.AsyncClient:
+    # One pooled client per process, created on first use
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=STRIPE_API_BASE,
+            auth=(os.getenv("STRIPE_API_KEY") or "", ""),
+            timeout=httpx.Timeout(STRIPE_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(max_connections=STRIPE_MAX_CONNECTIONS, max_keepalive_connections=STRIPE_MAX_CONNECTIONS),
+        )
+    return _client
+
+
+def _form(params, prefix: str = None) -> list:
+    """Flatten nested params the way Stripe expects: a[b][0][c]=value."""
+    if isinstance(params, dict):
+        items = params.items()
+    elif isinstance(params, (list, tuple)):
+        items = enumerate(params)
+    else:
+        return [(prefix, str(params).lower() if isinstance(params, bool) else str(params))]
+    fields = []
+    for key, value in items:
+        fields.extend(_form(value, f"{prefix}[{key}]" if prefix else str(key)))
+    return fields
+
+
+async def _post(path: str, params: dict) -> dict:
+    try:
+        response = await _get_client().post(path, data=_form(params))
+    except httpx.HTTPError as exc:
+        raise StripeError(f"Stripe request failed: {exc!r}") from exc
+    if response.status_code >= 400:
+        try:
+            message = response.json()["error"]["message"]
+        except Exception:
+            message = response.text
+        raise StripeError(message, status=response.status_code)
+    return response.json()
+
+
+async def create_checkout_session(**params) -> dict:
+    """POST /v1/checkout/sessions; returns the session object."""
+    return await _post("/v1/checkout/sessions", params)
+
+
+async def aclose():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
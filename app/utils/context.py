@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+from app.core.redis_client import redis_client
+from app.utils.history import HISTORY_WINDOW, load_history
+from app.utils.llm import get_backend
+
+# The prompt for a chatroom is a rolling summary of the conversation plus the
+# most recent turns that fit CONTEXT_MAX_TOKENS, so its size stays flat however
+# long the chatroom gets. The summary lives in a Redis hash next to a count of
+# turns not yet folded into it; every SUMMARY_EVERY turns a background task
+# folds them in, off the reply's critical path.
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+SUMMARY_EVERY = min(int(os.getenv("SUMMARY_EVERY", "10")), HISTORY_WINDOW)
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_TOKENS", "300")) * 4
+SUMMARY_KEY = "chatroom_summary:{chatroom_id}"
+SUMMARY_LOCK_KEY = "chatroom_summary:{chatroom_id}:lock"
+SUMMARY_TTL = 60 * 60 * 24 * 30
+SUMMARY_LOCK_TTL = 120
+
+SUMMARY_INSTRUCTION = (
+    "Update the summary of this conversation with the new messages. Keep names, "
+    "facts, decisions and open questions; drop small talk. Answer with the "
+    f"summary only, in at most {SUMMARY_MAX_CHARS // 4} tokens."
+)
+
+logger = logging.getLogger(__name__)
+
+# Refreshes in flight in this process (kept so they aren't garbage collected)
+_refreshes: set[asyncio.Task] = set()
+
+
+def _role(sender: str) -> str:
+    return "user" if sender == "user" else "model"
+
+
+async def build_context(chatroom_id: int, message_id: int) -> list[dict]:
+    """Messages to send to the LLM to answer `message_id`: summary, then recent turns."""
+    # Messages posted after the one we answer belong to later tasks and are
+    # cut before the token budget is spent, so they can't crowd it out
+    summary, turns = await asyncio.gather(
+        redis_client.hget(SUMMARY_KEY.format(chatroom_id=chatroom_id), "summary"),
+        load_history(chatroom_id, max_tokens=CONTEXT_MAX_TOKENS, require_id=message_id),
+    )
+    messages = [{"role": "system", "content": f"Summary of the earlier conversation: {summary}"}] if summary else []
+    messages.extend({"role": _role(t["sender"]), "content": t["content"]} for t in turns)
+    return messages
+
+
+async def after_reply(chatroom_id: int, turns: int = 2):
+    """Count a question and its answer; start a summary refresh when one is due."""
+    key = SUMMARY_KEY.format(chatroom_id=chatroom_id)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hincrby(key, "pending", turns)
+        pipe.expire(key, SUMMARY_TTL)
+        pending, _ = await pipe.execute()
+    if pending < SUMMARY_EVERY:
+        return
+    # One refresher per chatroom across all worker processes
+    if not await redis_client.set(SUMMARY_LOCK_KEY.format(chatroom_id=chatroom_id), 1, nx=True, ex=SUMMARY_LOCK_TTL):
+        return
+    task = asyncio.create_task(_refresh_locked(chatroom_id))
+    _refreshes.add(task)
+    task.add_done_callback(_refreshes.discard)
+
+
+async def _refresh_locked(chatroom_id: int):
+    try:
+        await refresh_summary(chatroom_id)
+    except Exception as exc:
+        # The turns stay pending; the next reply tries again
+        logger.warning("Summary refresh failed for chatroom %s: %s", chatroom_id, exc)
+    finally:
+        await redis_client.delete(SUMMARY_LOCK_KEY.format(chatroom_id=chatroom_id))
+
+
+async def refresh_summary(chatroom_id: int):
+    """Fold the turns counted since the last refresh into the chatroom's summary."""
+    key = SUMMARY_KEY.format(chatroom_id=chatroom_id)
+    state = await redis_client.hgetall(key)
+    pending = int(state.get("pending", 0))
+    if pending <= 0:
+        return
+    # Turns older than the ring buffer (after failed refreshes) are skipped
+    turns = await load_history(chatroom_id, limit=min(pending, HISTORY_WINDOW))
+    transcript = "\n".join(f"{_role(t['sender'])}: {t['content']}" for t in turns)
+    prompt = f"{SUMMARY_INSTRUCTION}\n\nCurrent summary:\n{state.get('summary') or '(none)'}\n\nNew messages:\n{transcript}"
+    summary = (await get_backend().generate([{"role": "user", "content": prompt}])).strip()
+    async with redis_client.pipeline(transaction=True) as pipe:
+        # Capped whatever the model returns, so prompts can't grow through the summary
+        pipe.hset(key, "summary", summary[:SUMMARY_MAX_CHARS])
+        # Turns counted while we were summarizing stay pending
+        pipe.hincrby(key, "pending", -pending)
+        pipe.expire(key, SUMMARY_TTL)
+        await pipe.execute()
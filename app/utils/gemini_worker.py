@@ -1,47 +1,141 @@
+import argparse
 import asyncio
-import json
-from app.core.redis_client import redis_client
-from app.utils.gemini import send_to_gemini
-from app.models.message import Message
-from app.core.database import AsyncSessionLocal
-from sqlalchemy import select
+import logging
+import multiprocessing
+from app.utils.gemini import send_to_gemini, send_to_gemini_stream
 from app.models.chatroom import Chatroom
 from app.models.user import User
+from app.utils.replies import publish_reply
+from app.utils.streams import publish_event
+from app.utils.history import record_turn
+from app.utils import context
+from app.utils.worker_engine import WorkerEngine
+from app.utils.queue import migrate_legacy_queue
+from app.utils.reply_writer import reply_writer
+from app.utils.quota import refund
+from app.utils import idempotency
+from app.utils.metrics import TASK_PHASE, serve_metrics
+from app.utils.prompt_cache import cacheable, get_cached_reply, store_reply
+from app.utils.llm import get_backend
 
-async def gemini_worker():
-    print("Gemini worker started...")
-    while True:
-        task_json = await redis_client.lpop("gemini_message_queue")
-        if not task_json:
-            await asyncio.sleep(1)
-            continue
-        task = json.loads(task_json)
-        chatroom_id = task["chatroom_id"]
-        user_id = task["user_id"]
-        message_id = task["message_id"]
-        content = task["content"]
-        # Build conversation history (optional: fetch last N messages)
-        async with AsyncSessionLocal() as db:
-            result = await db.execute(select(Message).where(Message.chatroom_id == chatroom_id).order_by(Message.created_at.desc()))
-            all_msgs = result.scalars().all()
-            # Only use the last user message as context
-            last_user_msg = next((m for m in all_msgs if m.sender == "user"), None)
-            if last_user_msg:
-                history = [{"role": "user", "content": last_user_msg.content}]
+GEMINI_ERROR_REPLY = "[Gemini API error: could not get response]"
+
+logger = logging.getLogger(__name__)
+
+
+async def process_task(task: dict):
+    chatroom_id = task["chatroom_id"]
+    message_id = task["message_id"]
+    # Rolling summary plus the recent turns that fit the token budget; the turns
+    # come from the chatroom's Redis ring buffer, or a bounded MySQL read
+    with TASK_PHASE.time("history"):
+        history = await context.build_context(chatroom_id, message_id)
+    # Identical short prompts are answered from the cache without calling Gemini
+    use_cache = cacheable(history, task.get("tier"))
+    model = get_backend().model
+    gemini_response = await get_cached_reply(history, model) if use_cache else None
+    if gemini_response is not None:
+        if task.get("stream"):
+            await publish_event(message_id, "token", {"text": gemini_response})
+    else:
+        # Send to Gemini; failures are retried by the engine
+        with TASK_PHASE.time("llm"):
+            if task.get("stream"):
+                gemini_response = await stream_reply(task, history)
             else:
-                history = []
-        # Send to Gemini
-        try:
-            gemini_response = await send_to_gemini(history)
-        except Exception as e:
-            print(f"Gemini API error: {e}")
-            gemini_response = "[Gemini API error: could not get response]"
-        # Save Gemini response to DB
-        async with AsyncSessionLocal() as db:
-            ai_message = Message(chatroom_id=chatroom_id, sender="ai", content=gemini_response)
-            db.add(ai_message)
-            await db.commit()
-        print(f"Gemini response saved for chatroom {chatroom_id}")
+                gemini_response = await send_to_gemini(history)
+        if use_cache:
+            await store_reply(history, model, gemini_response)
+    with TASK_PHASE.time("db_write"):
+        await save_reply(chatroom_id, message_id, gemini_response)
+    await _best_effort("complete request", message_id, complete_request(task, gemini_response))
+    # May start a background summary refresh; never delays this reply
+    await _best_effort("after_reply", message_id, context.after_reply(chatroom_id))
+    if task.get("stream"):
+        await _best_effort("done event", message_id, publish_event(message_id, "done", {"message_id": message_id, "content": gemini_response}))
+    logger.info("Gemini response saved for chatroom %s", chatroom_id)
+
+
+async def stream_reply(task: dict, history: list[dict]) -> str:
+    """Relay Gemini's chunks to the stream of the task's message and return the full text."""
+    message_id = task["message_id"]
+    if task.get("attempts"):
+        # A previous attempt may have sent partial output
+        await publish_event(message_id, "reset", {"message_id": message_id})
+    parts = []
+    async for chunk in send_to_gemini_stream(history):
+        parts.append(chunk)
+        await publish_event(message_id, "token", {"text": chunk})
+    return "".join(parts)
+
+
+async def save_reply(chatroom_id: int, message_id: int, content: str):
+    # Batched with the replies of other worker slots; returns once committed
+    await reply_writer.write(chatroom_id, content)
+    # Multi-row inserts don't report ids, and nothing reading the buffer needs an AI message's id
+    await _best_effort("record turn", message_id, record_turn(chatroom_id, None, "ai", content))
+    # Wake up the request waiting on this message, now that the row is durable
+    await _best_effort("publish reply", message_id, publish_reply(message_id, {"chatroom_id": chatroom_id, "content": content}))
+
+
+async def _best_effort(step: str, message_id: int, coro):
+    # Once the reply row is committed the task must not fail: the engine would
+    # run it again, calling Gemini and storing a second reply
+    try:
+        await coro
+    except Exception as exc:
+        logger.warning("Reply to message %s is saved but %s failed: %s", message_id, step, exc)
+
+
+async def complete_request(task: dict, content: str):
+    # Replays of the request's Idempotency-Key are answered from this record
+    # long after the reply key has expired
+    if task.get("idempotency_key"):
+        body = idempotency.reply_body(task["message_id"], content)
+        await idempotency.complete(task["user_id"], task["idempotency_key"], 200, body)
+
+
+async def on_dead_task(task: dict, exc: Exception):
+    # Out of retries: store the error reply as before so the client isn't left waiting,
+    # and give the user their message back
+    logger.warning("Gemini API error for message %s: %s", task.get("message_id"), exc)
+    await refund(task.get("quota"))
+    await save_reply(task["chatroom_id"], task["message_id"], GEMINI_ERROR_REPLY)
+    await complete_request(task, GEMINI_ERROR_REPLY)
+    if task.get("stream"):
+        await publish_event(task["message_id"], "error", {"message_id": task["message_id"], "content": GEMINI_ERROR_REPLY})
+
+
+async def gemini_worker(concurrency: int = 4, metrics_port: int = None):
+    logger.info("Gemini worker started with %d slots", concurrency)
+    if metrics_port:
+        await serve_metrics(metrics_port)
+    moved = await migrate_legacy_queue()
+    if moved:
+        logger.info("Moved %d tasks from the single-list queue to the partitions", moved)
+    engine = WorkerEngine(process_task, concurrency=concurrency, on_dead=on_dead_task)
+    await engine.run()
+
+
+def _run_process(concurrency: int, metrics_port: int = None):
+    asyncio.run(gemini_worker(concurrency, metrics_port))
+
 
 if __name__ == "__main__":
-    asyncio.run(gemini_worker())
+    parser = argparse.ArgumentParser(description="Gemini task worker")
+    parser.add_argument("--concurrency", type=int, default=4, help="tasks handled concurrently per process")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to start")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve /metrics on this port (port + i for process i)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.processes == 1:
+        _run_process(args.concurrency, args.metrics_port)
+    else:
+        procs = [
+            multiprocessing.Process(target=_run_process, args=(args.concurrency, args.metrics_port and args.metrics_port + i))
+            for i in range(args.processes)
+        ]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
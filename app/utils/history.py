@@ -0,0 +1,96 @@
+import json
+import os
+from sqlalchemy import select
+from app.core.database import AsyncSessionLocal
+from app.core.redis_client import redis_client
+from app.models.message import Message
+from app.utils.pagination import messages_before
+
+# Number of recent turns kept per chatroom in Redis, and the most the worker loads
+HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "20"))
+HISTORY_KEY = "chatroom_history:{chatroom_id}"
+HISTORY_TTL = 60 * 60 * 24
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough but cheap: ~4 characters per token for English text
+    return len(text) // 4 + 1
+
+
+def _turn(message_id, sender: str, content: str) -> dict:
+    return {"id": message_id, "sender": sender, "content": content}
+
+
+async def record_turn(chatroom_id: int, message_id, sender: str, content: str):
+    """Push a new message onto the chatroom's ring buffer, if the buffer is loaded."""
+    key = HISTORY_KEY.format(chatroom_id=chatroom_id)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        # LPUSHX: a missing buffer is rebuilt from MySQL on the next read instead
+        # of starting out with just this one message
+        pipe.lpushx(key, json.dumps(_turn(message_id, sender, content)))
+        pipe.ltrim(key, 0, HISTORY_WINDOW - 1)
+        pipe.expire(key, HISTORY_TTL)
+        await pipe.execute()
+
+
+async def fetch_turns(chatroom_id: int, limit: int, before: tuple = None) -> list[dict]:
+    """
+    Read up to `limit` messages older than `before` = (created_at, id) from MySQL,
+    newest first. Served by the (chatroom_id, created_at, id) index.
+    """
+    query = select(Message.id, Message.sender, Message.content).where(Message.chatroom_id == chatroom_id)
+    if before is not None:
+        query = query.where(messages_before(*before))
+    query = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(query)
+        return [_turn(row.id, row.sender, row.content) for row in result]
+
+
+async def _load_recent(chatroom_id: int, require_id=None) -> list[dict]:
+    key = HISTORY_KEY.format(chatroom_id=chatroom_id)
+    cached = await redis_client.lrange(key, 0, HISTORY_WINDOW - 1)
+    if cached:
+        turns = [json.loads(item) for item in cached]
+        # A buffer rebuilt concurrently with a write can miss that write; if
+        # the message we are answering isn't there, don't trust the buffer
+        if require_id is None or any(t["id"] == require_id for t in turns):
+            return turns
+    turns = await fetch_turns(chatroom_id, HISTORY_WINDOW)
+    if turns:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.rpush(key, *[json.dumps(t) for t in turns])
+            pipe.expire(key, HISTORY_TTL)
+            await pipe.execute()
+    return turns
+
+
+async def load_history(chatroom_id: int, limit: int = HISTORY_WINDOW, max_tokens: int = None, require_id=None) -> list[dict]:
+    """
+    Return the chatroom's most recent turns, oldest first: at most `limit` of
+    them and, if given, no more than `max_tokens` worth. Comes from the Redis
+    ring buffer when possible and from a bounded MySQL read otherwise.
+    `require_id` is a message id that must be part of the result; turns newer
+    than it are left out before the limits apply.
+    """
+    if limit <= HISTORY_WINDOW:
+        turns = await _load_recent(chatroom_id, require_id)
+    else:
+        turns = await fetch_turns(chatroom_id, limit)
+    if require_id is not None:
+        for i, turn in enumerate(turns):
+            if turn["id"] == require_id:
+                turns = turns[i:]
+                break
+    turns = turns[:limit]
+    if max_tokens is not None:
+        budget, kept = max_tokens, []
+        for turn in turns:
+            budget -= estimate_tokens(turn["content"])
+            if budget < 0 and kept:
+                break
+            kept.append(turn)
+        turns = kept
+    turns.reverse()
+    return turns
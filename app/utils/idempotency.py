@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+import json
+from app.core.redis_client import redis_client
+
+# Idempotency-Key support for POST /chatroom/{id}/message. A key is claimed
+# before any work starts, together with a fingerprint of the request it belongs
+# to; it records the message id once the message is saved, and the final
+# response once the AI reply is in. The worker completes the record when it
+# publishes the reply, so replays are answered after the reply key is gone.
+IDEMPOTENCY_TTL = 60 * 60 * 24
+IDEMPOTENCY_KEY = "idempotency:{user_id}:{key}"
+# How long a replay waits for the original request to save its message
+ATTACH_TIMEOUT = 2.0
+
+# The record is a hash, so attach (message_id) and complete (state, status,
+# body) never overwrite each other's fields whichever runs first
+_BEGIN = """
+local record = redis.call('hgetall', KEYS[1])
+if #record > 0 then
+    return record
+end
+redis.call('hset', KEYS[1], 'state', 'pending', 'fingerprint', ARGV[1])
+redis.call('expire', KEYS[1], ARGV[2])
+return {}
+"""
+# Only records that still exist are updated: a released or expired key must not
+# come back without a TTL
+_UPDATE = """
+if redis.call('exists', KEYS[1]) == 1 then
+    redis.call('hset', KEYS[1], unpack(ARGV))
+    return 1
+end
+return 0
+"""
+
+
+def _key(user_id: int, key: str) -> str:
+    return IDEMPOTENCY_KEY.format(user_id=user_id, key=key)
+
+
+def fingerprint(chatroom_id: int, content: str) -> str:
+    digest = hashlib.sha256(content.encode()).hexdigest()
+    return f"{chatroom_id}:{digest}"
+
+
+def reply_body(message_id: int, content: str) -> dict:
+    """Body of the 200 response for a message whose AI reply is `content`."""
+    return {"success": True, "message_id": message_id, "ai_message": content}
+
+
+def _record(fields: dict) -> dict:
+    record = dict(fields)
+    if "message_id" in record:
+        record["message_id"] = int(record["message_id"])
+    if "status" in record:
+        record["status"] = int(record["status"])
+    if "body" in record:
+        record["body"] = json.loads(record["body"])
+    return record
+
+
+async def begin(user_id: int, key: str, request_fingerprint: str):
+    """Claim the key. Returns None if we own it now, else the existing record."""
+    existing = await redis_client.eval(_BEGIN, 1, _key(user_id, key), request_fingerprint, IDEMPOTENCY_TTL)
+    # HGETALL inside a script comes back as a flat [field, value, ...] list
+    return _record(zip(existing[::2], existing[1::2])) if existing else None
+
+
+async def attach(user_id: int, key: str, message_id: int):
+    await redis_client.eval(_UPDATE, 1, _key(user_id, key), "message_id", message_id)
+
+
+async def complete(user_id: int, key: str, status: int, body: dict):
+    await redis_client.eval(_UPDATE, 1, _key(user_id, key), "state", "done", "status", status, "body", json.dumps(body))
+
+
+async def release(user_id: int, key: str):
+    """Forget the key so the client can retry, e.g. when the request was rejected."""
+    await redis_client.delete(_key(user_id, key))
+
+
+async def wait_for_message_id(user_id: int, key: str, record: dict):
+    """Give the original request a moment to save its message; returns the latest record."""
+    deadline = asyncio.get_running_loop().time() + ATTACH_TIMEOUT
+    while record and record["state"] == "pending" and "message_id" not in record:
+        if asyncio.get_running_loop().time() >= deadline:
+            break
+        await asyncio.sleep(0.05)
+        fields = await redis_client.hgetall(_key(user_id, key))
+        record = _record(fields) if fields else None
+    return record
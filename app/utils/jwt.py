@@ -1,10 +1,16 @@
+import hashlib
 import os
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from app.utils.cache import TTLCache
 
 SECRET_KEY = os.getenv("JWT_SECRET", "secret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
+TOKEN_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+
+# sha256(token) -> decoded payload, dropped once the token's `exp` passes
+_verified_tokens = TTLCache(maxsize=TOKEN_CACHE_SIZE)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -14,8 +20,15 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return encoded_jwt
 
 def verify_access_token(token: str):
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = _verified_tokens.get(digest)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         return None
+    # Tokens without an expiry are not cached, so they are always re-checked
+    if isinstance(payload.get("exp"), (int, float)):
+        _verified_tokens.set(digest, payload, expires_at=payload["exp"])
+    return payload
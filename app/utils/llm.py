@@ -0,0 +1,192 @@
+import asyncio
+import json
+import os
+import time
+import httpx
+from app.utils.metrics import LLM_REQUEST_DURATION, LLM_REQUESTS, LLM_PROMPT_BYTES
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")  # "gemini" or "fake"
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+
+
+def compose_prompt(messages: list[dict]) -> str:
+    # Compose the conversation as a single string (simple version)
+    return "\n".join([f"{m['role']}: {m['content']}" for m in messages])
+
+
+def _outcome(exc: BaseException) -> str:
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    return "error"
+
+
+class LLMBackend:
+    """
+    Base class for LLM backends. Subclasses implement `_generate` and `_stream`;
+    `generate` and `stream` add a limit on in-flight calls and a per-call
+    timeout. Cancelling the caller cancels the underlying request.
+    """
+    model = None
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT):
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate(self, messages: list[dict], timeout: float = None) -> str:
+        LLM_PROMPT_BYTES.observe(len(compose_prompt(messages).encode()), self.model)
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                reply = await asyncio.wait_for(self._generate(messages), timeout or self.timeout)
+            except BaseException as exc:
+                LLM_REQUESTS.inc(self.model, _outcome(exc))
+                raise
+            LLM_REQUEST_DURATION.observe(time.perf_counter() - start, self.model)
+            LLM_REQUESTS.inc(self.model, "ok")
+            return reply
+
+    async def stream(self, messages: list[dict], timeout: float = None):
+        """Yield response text chunks; `timeout` bounds the whole generation."""
+        LLM_PROMPT_BYTES.observe(len(compose_prompt(messages).encode()), self.model)
+        async with self._semaphore:
+            start = time.perf_counter()
+            deadline = time.monotonic() + (timeout or self.timeout)
+            chunks = self._stream(messages)
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), remaining)
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+            except BaseException as exc:
+                LLM_REQUESTS.inc(self.model, _outcome(exc))
+                raise
+            finally:
+                await chunks.aclose()
+            LLM_REQUEST_DURATION.observe(time.perf_counter() - start, self.model)
+            LLM_REQUESTS.inc(self.model, "ok")
+
+    async def _generate(self, messages: list[dict]) -> str:
+        raise NotImplementedError
+
+    async def _stream(self, messages: list[dict]):
+        # Backends without native streaming return the whole reply as one chunk
+        yield await self._generate(messages)
+
+    async def aclose(self):
+        pass
+
+
+class GeminiBackend(LLMBackend):
+    """Gemini over its REST API, through one pooled httpx client per process."""
+
+    def __init__(self, api_key: str = None, model: str = GEMINI_MODEL, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        self.model = model
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on first use so importing the app doesn't open anything
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=GEMINI_API_BASE,
+                headers={"x-goog-api-key": self.api_key or ""},
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_CONCURRENCY),
+            )
+        return self._client
+
+    def _body(self, messages: list[dict]) -> dict:
+        return {"contents": [{"role": "user", "parts": [{"text": compose_prompt(messages)}]}]}
+
+    @staticmethod
+    def _text(data: dict) -> str:
+        candidates = data.get("candidates") or []
+        if not candidates:
+            return ""
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+    async def _generate(self, messages: list[dict]) -> str:
+        response = await self.client.post(f"/models/{self.model}:generateContent", json=self._body(messages))
+        response.raise_for_status()
+        return self._text(response.json())
+
+    async def _stream(self, messages: list[dict]):
+        async with self.client.stream(
+            "POST", f"/models/{self.model}:streamGenerateContent", params={"alt": "sse"}, json=self._body(messages)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                text = self._text(json.loads(line[5:]))
+                if text:
+                    yield text
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic offline backend for tests and benchmarks: echoes the last
+    message after `latency` seconds plus `latency_per_kb` per KB of prompt,
+    streaming it word by word.
+    """
+    model = "fake"
+
+    def __init__(self, latency: float = None, chunk_latency: float = 0.0, latency_per_kb: float = None, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = float(os.getenv("FAKE_LLM_LATENCY_MS", "0")) / 1000 if latency is None else latency
+        self.latency_per_kb = float(os.getenv("FAKE_LLM_LATENCY_PER_KB_MS", "0")) / 1000 if latency_per_kb is None else latency_per_kb
+        self.chunk_latency = chunk_latency
+        self.calls = 0
+        self.prompt_bytes = 0
+
+    def reply_for(self, messages: list[dict]) -> str:
+        last = messages[-1]["content"] if messages else ""
+        return f"Echo: {last}"
+
+    async def _generate(self, messages: list[dict]) -> str:
+        size = len(compose_prompt(messages).encode())
+        self.calls += 1
+        self.prompt_bytes += size
+        await asyncio.sleep(self.latency + self.latency_per_kb * size / 1024)
+        return self.reply_for(messages)
+
+    async def _stream(self, messages: list[dict]):
+        reply = await self._generate(messages)
+        words = reply.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.chunk_latency)
+            yield word if i == len(words) - 1 else word + " "
+
+
+_backend = None
+
+
+def get_backend() -> LLMBackend:
+    global _backend
+    if _backend is None:
+        _backend = FakeBackend() if LLM_BACKEND == "fake" else GeminiBackend()
+    return _backend
+
+
+def set_backend(backend: LLMBackend):
+    """Swap the process-wide backend (tests, benchmarks)."""
+    global _backend
+    _backend = backend
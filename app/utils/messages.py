@@ -0,0 +1,41 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.chatroom import Chatroom
+from app.models.message import Message
+from app.utils.history import record_turn
+from app.utils.queue import enqueue_gemini_task, admit_task, release_task
+from app.utils.quota import refund
+
+# Posting a user message, shared by the HTTP routes and the WebSocket.
+
+
+async def save_and_enqueue(db: AsyncSession, chatroom_id: int, user, content: str, reservation: dict, stream: bool = False, idempotency_key: str = None):
+    """
+    Store the user's message and queue it for Gemini. Returns (message, queue
+    wait of the user's tier in seconds); message is None if the chatroom isn't
+    the user's. Raises Overloaded if the queue refuses the message.
+    """
+    tier = user.subscription.lower()
+    try:
+        queue_wait = await admit_task(user.id, tier)
+    except Exception:
+        await refund(reservation)
+        raise
+    try:
+        result = await db.execute(select(Chatroom.id).where((Chatroom.id == chatroom_id) & (Chatroom.user_id == user.id)))
+        if result.first() is None:
+            await refund(reservation)
+            await release_task(user.id)
+            return None, queue_wait
+        message = Message(chatroom_id=chatroom_id, sender="user", content=content)
+        db.add(message)
+        # No refresh: the id is set by the insert, and skipping the extra SELECT
+        # releases the DB connection before we wait for the reply
+        await db.commit()
+    except Exception:
+        await refund(reservation)
+        await release_task(user.id)
+        raise
+    await record_turn(chatroom_id, message.id, "user", content)
+    await enqueue_gemini_task(chatroom_id, user.id, message.id, content, stream=stream, quota=reservation, tier=tier, idempotency_key=idempotency_key)
+    return message, queue_wait
@@ -0,0 +1,178 @@
+import asyncio
+import bisect
+import os
+import time
+
+# Minimal Prometheus-style metrics. Everything runs on the event loop thread, so
+# recording a value is a dict lookup and an addition, with no locks.
+
+# Metrics describe traffic and capacity, so the API never serves them openly:
+# METRICS_PORT serves them on an internal port (as the worker's --metrics-port
+# does), and METRICS_TOKEN enables GET /metrics on the API port for scrapers
+# sending "Authorization: Bearer <token>".
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+_collectors = []
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        _metrics.append(self)
+
+    def _label_str(self, values: tuple, extra: str = "") -> str:
+        parts = [f'{k}="{v}"' for k, v in zip(self.labels, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{self._label_str(values)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            # per-bucket counts, sum, count
+            entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            entry[0][index] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = self._label_str(values, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = self._label_str(values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{self._label_str(values)} {total}")
+            lines.append(f"{self.name}_count{self._label_str(values)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+def register_collector(fn):
+    """Register an async callable that refreshes gauges right before each scrape."""
+    _collectors.append(fn)
+    return fn
+
+
+async def render() -> str:
+    for collector in _collectors:
+        try:
+            await collector()
+        except Exception:
+            # A failing collector (e.g. Redis down) shouldn't break the scrape
+            pass
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(port: int):
+    """Expose render() over plain HTTP, for processes without the API (the worker)."""
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = (await render()).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "0.0.0.0", port)
+
+
+def instrument_pool(pool):
+    """Time how long callers wait to check a connection out of a SQLAlchemy pool."""
+    # _do_get is where every pool implementation acquires (or waits for) a connection
+    do_get = pool._do_get
+
+    def timed_do_get():
+        start = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+    pool._do_get = timed_do_get
+
+    @register_collector
+    async def collect_pool():
+        if hasattr(pool, "checkedout"):
+            DB_POOL_CHECKED_OUT.set(pool.checkedout())
+            DB_POOL_SIZE.set(pool.size())
+
+
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+QUEUE_DEPTH = Gauge("gemini_queue_depth", "Gemini tasks waiting, in flight or dead-lettered", ("tier", "state"))
+TASK_AGE = Histogram("gemini_task_age_seconds", "Queue wait: time from enqueue to the start of processing", ("tier",))
+TASK_PHASE = Histogram("gemini_task_phase_seconds", "Worker time per processing phase", ("phase",))
+TASKS = Counter("gemini_tasks_total", "Gemini tasks by outcome", ("outcome",))
+DB_POOL_CHECKOUT_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a DB connection")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "DB connections currently checked out")
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured DB pool size")
+REDIS_ROUND_TRIPS = Counter("redis_round_trips_total", "Commands or pipelines sent to Redis")
+LLM_REQUEST_DURATION = Histogram("llm_request_duration_seconds", "LLM call latency", ("backend",))
+LLM_PROMPT_BYTES = Histogram("llm_prompt_bytes", "Size of prompts sent to the LLM", ("backend",),
+                             buckets=(256, 1024, 4096, 8192, 16384, 32768, 65536, 131072))
+LLM_REQUESTS = Counter("llm_requests_total", "LLM calls by outcome", ("backend", "outcome"))
+PROMPT_CACHE_LOOKUPS = Counter("prompt_cache_lookups_total", "Prompt cache lookups by result", ("result",))
@@ -0,0 +1,83 @@
+import asyncio
+import re
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.redis_client import redis_client
+from app.core.database import AsyncSessionLocal
+from app.models.user import User
+
+# Mobiles are stored, compared, cached and put in JWTs as one canonical string:
+# digits only, no leading "+". Comparing users.mobile (a VARCHAR) against a
+# string keeps MySQL on the unique index.
+_SEPARATORS = re.compile(r"[\s\-().]")
+
+# Redis set of every registered mobile, so OTP requests for unknown numbers cost
+# no SQL. Until REGISTERED_READY_KEY is set (see rebuild_registered_index) a
+# miss falls back to the database.
+REGISTERED_KEY = "registered_mobiles"
+REGISTERED_READY_KEY = "registered_mobiles:ready"
+REBUILD_CHUNK_SIZE = 10000
+
+
+def canonical_mobile(value) -> str:
+    """Return the canonical form of a mobile number; raises ValueError if invalid."""
+    if isinstance(value, bool):
+        raise ValueError("Invalid mobile number")
+    if isinstance(value, int):
+        value = str(value)
+    if not isinstance(value, str):
+        raise ValueError("Invalid mobile number")
+    digits = _SEPARATORS.sub("", value.strip())
+    if digits.startswith("+"):
+        digits = digits[1:]
+    # E.164 numbers have at most 15 digits
+    if not digits.isdigit() or not 6 <= len(digits) <= 15:
+        raise ValueError("Invalid mobile number")
+    return digits
+
+
+async def mark_registered(mobile: str):
+    await redis_client.sadd(REGISTERED_KEY, mobile)
+
+
+async def is_registered(mobile: str, db: AsyncSession) -> bool:
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.sismember(REGISTERED_KEY, mobile)
+        pipe.exists(REGISTERED_READY_KEY)
+        member, ready = await pipe.execute()
+    if member:
+        return True
+    if ready:
+        return False
+    # Index not built yet: ask the unique index on users.mobile
+    result = await db.execute(select(User.id).where(User.mobile == mobile))
+    return result.first() is not None
+
+
+async def rebuild_registered_index():
+    """Add every stored mobile to the index, then mark it complete."""
+    # Adds into the live set (mobiles are never removed), so signups running
+    # concurrently are not lost
+    last_id = 0
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(User.id, User.mobile).where(User.id > last_id).order_by(User.id).limit(REBUILD_CHUNK_SIZE)
+            )).all()
+        if not rows:
+            break
+        await redis_client.sadd(REGISTERED_KEY, *(row.mobile for row in rows))
+        total += len(rows)
+        last_id = rows[-1].id
+    await redis_client.set(REGISTERED_READY_KEY, 1)
+    return total
+
+
+async def _main():
+    total = await rebuild_registered_index()
+    print(f"Indexed {total} registered mobiles")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
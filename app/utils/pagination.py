@@ -0,0 +1,40 @@
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+from app.models.message import Message
+
+# Keyset pagination over messages ordered by (created_at, id) descending. Cursors
+# are opaque to clients and encode the last row of the previous page.
+
+
+def encode_cursor(created_at: datetime, message_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Return (created_at, id); raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, message_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def messages_before(created_at: datetime, message_id: int):
+    """WHERE clause for rows strictly older than (created_at, id)."""
+    # Spelled out rather than a row-value comparison so MySQL uses the
+    # (chatroom_id, created_at, id) index as a range
+    return or_(
+        Message.created_at < created_at,
+        and_(Message.created_at == created_at, Message.id < message_id),
+    )
+
+
+def messages_after(created_at: datetime, message_id: int):
+    """WHERE clause for rows strictly newer than (created_at, id)."""
+    return or_(
+        Message.created_at > created_at,
+        and_(Message.created_at == created_at, Message.id > message_id),
+    )
@@ -0,0 +1,49 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+
+# bcrypt takes tens to hundreds of milliseconds of CPU per call, so it runs in a
+# small process pool instead of on the event loop.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=BCRYPT_ROUNDS)
+
+_executor = None
+_slots = None
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, password_hash: str) -> bool:
+    return pwd_context.verify(password, password_hash)
+
+
+async def _run(fn, *args):
+    global _executor, _slots
+    if _executor is None:
+        # spawn: forking a process that runs an event loop and threads isn't safe
+        _executor = ProcessPoolExecutor(PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        # Bounds the backlog handed to the pool; extra callers wait here
+        _slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS * 2)
+    async with _slots:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    return await _run(_verify, password, password_hash)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import time
+from app.core.redis_client import redis_client
+from app.utils.cache import TTLCache
+from app.utils.llm import compose_prompt
+from app.utils.metrics import PROMPT_CACHE_LOOKUPS
+
+# Replies to identical short prompts are reused instead of calling the LLM again.
+# Tier 1 is a per-process LRU, tier 2 a Redis key per prompt with a TTL; the
+# Redis tier is capped at PROMPT_CACHE_REDIS_SIZE entries, least recently stored
+# first out.
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", "3600"))
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "5000"))
+PROMPT_CACHE_REDIS_SIZE = int(os.getenv("PROMPT_CACHE_REDIS_SIZE", "100000"))
+PROMPT_CACHE_MAX_CHARS = int(os.getenv("PROMPT_CACHE_MAX_CHARS", "500"))
+# Tiers whose messages may be answered from the cache (empty to disable)
+PROMPT_CACHE_TIERS = {t for t in os.getenv("PROMPT_CACHE_TIERS", "basic,pro").lower().split(",") if t}
+
+PROMPT_KEY = "prompt_cache:{digest}"
+PROMPT_INDEX_KEY = "prompt_cache:index"
+
+_SET_BOUNDED = """
+redis.call('setex', KEYS[1], ARGV[1], ARGV[2])
+redis.call('zadd', KEYS[2], ARGV[3], KEYS[1])
+local extra = redis.call('zcard', KEYS[2]) - tonumber(ARGV[4])
+if extra > 0 then
+    local victims = redis.call('zrange', KEYS[2], 0, extra - 1)
+    redis.call('del', unpack(victims))
+    redis.call('zremrangebyrank', KEYS[2], 0, extra - 1)
+end
+return 1
+"""
+
+_near_cache = TTLCache(maxsize=PROMPT_CACHE_SIZE, ttl=PROMPT_CACHE_TTL)
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split()).casefold()
+
+
+def _key(prompt: str, model: str) -> str:
+    digest = hashlib.sha256(f"{model}\0{normalize_prompt(prompt)}".encode()).hexdigest()
+    return PROMPT_KEY.format(digest=digest)
+
+
+def cacheable(messages: list[dict], tier: str) -> bool:
+    return (tier or "basic") in PROMPT_CACHE_TIERS and len(compose_prompt(messages)) <= PROMPT_CACHE_MAX_CHARS
+
+
+async def get_cached_reply(messages: list[dict], model: str):
+    key = _key(compose_prompt(messages), model)
+    reply = _near_cache.get(key)
+    if reply is not None:
+        PROMPT_CACHE_LOOKUPS.inc("near_hit")
+        return reply
+    reply = await redis_client.get(key)
+    if reply is not None:
+        PROMPT_CACHE_LOOKUPS.inc("redis_hit")
+        _near_cache.set(key, reply)
+        return reply
+    PROMPT_CACHE_LOOKUPS.inc("miss")
+    return None
+
+
+async def store_reply(messages: list[dict], model: str, reply: str):
+    key = _key(compose_prompt(messages), model)
+    _near_cache.set(key, reply)
+    await redis_client.eval(_SET_BOUNDED, 2, key, PROMPT_INDEX_KEY, PROMPT_CACHE_TTL, reply, time.time(), PROMPT_CACHE_REDIS_SIZE)
@@ -1,16 +1,255 @@
-import asyncio
 import json
+import math
+import os
+import time
 from app.core.redis_client import redis_client
+from app.utils.metrics import QUEUE_DEPTH, register_collector
 
 QUEUE_NAME = "gemini_message_queue"
+# Tasks are spread over partitions by chatroom. A partition is only ever drained
+# by one worker at a time, which keeps messages of a chatroom in order while
+# different chatrooms are processed concurrently.
+QUEUE_PARTITIONS = int(os.getenv("GEMINI_QUEUE_PARTITIONS", "16"))
+DEAD_LETTER_KEY = f"{QUEUE_NAME}:dead"
+# Before tiers and partitions, every task was pushed to the single list
+# QUEUE_NAME. Nothing reads it now; workers move what is left of it into the
+# partitions when they start (migrate_legacy_queue).
+LEGACY_LOCK_KEY = f"{QUEUE_NAME}:legacy:lock"
 
-async def enqueue_gemini_task(chatroom_id: int, user_id: int, message_id: int, content: str):
+
+def _per_tier(value: str, cast) -> dict:
+    return {tier.strip(): cast(v) for tier, v in (item.split(":") for item in value.split(",") if item.strip())}
+
+
+# Every tier has its own partitions and ready list. Workers pick tiers by
+# weighted round robin, so while all tiers have work about weight/sum(weights)
+# of the partitions drained come from each tier and none is starved.
+TIER_WEIGHTS = _per_tier(os.getenv("GEMINI_TIER_WEIGHTS", "pro:3,basic:1"), int)
+TIERS = list(TIER_WEIGHTS)
+DEFAULT_TIER = "basic" if "basic" in TIER_WEIGHTS else TIERS[-1]
+# Queue wait (seconds) each tier should stay under. Above it, posting a message
+# answers 202 at once instead of holding the request; above
+# GEMINI_SHED_FACTOR times it, new messages are refused with 503.
+QUEUE_WAIT_SLO = _per_tier(os.getenv("GEMINI_WAIT_SLO", "pro:5,basic:15"), float)
+SHED_FACTOR = float(os.getenv("GEMINI_SHED_FACTOR", "3"))
+# Tasks a user may have queued or in flight at once (0: no limit)
+USER_PENDING_LIMIT = int(os.getenv("GEMINI_USER_PENDING_LIMIT", "10"))
+PENDING_TTL = 3600
+
+# One round trip per posted message: per-user cap, then the tier's queue wait,
+# i.e. the age of the oldest task still queued in any of its partitions. It
+# keeps growing while workers are stalled, unlike the wait of finished tasks.
+# KEYS: pending counter, then the tier's partition queues
+_ADMIT = """
+local limit = tonumber(ARGV[1])
+local oldest = tonumber(ARGV[2])
+for i = 2, #KEYS do
+    local head = redis.call('lindex', KEYS[i], 0)
+    if head then
+        local enqueued = tonumber(cjson.decode(head).enqueued_at)
+        if enqueued and enqueued < oldest then oldest = enqueued end
+    end
+end
+local wait = string.format('%.3f', math.max(tonumber(ARGV[2]) - oldest, 0))
+if tonumber(wait) > tonumber(ARGV[3]) then
+    return {2, wait}
+end
+if limit > 0 then
+    if redis.call('incr', KEYS[1]) > limit then
+        redis.call('decr', KEYS[1])
+        return {1, wait}
+    end
+    redis.call('expire', KEYS[1], ARGV[4])
+end
+return {0, wait}
+"""
+_RELEASE = """
+if tonumber(redis.call('get', KEYS[1]) or '0') > 0 then
+    return redis.call('decr', KEYS[1])
+end
+return 0
+"""
+# A chatroom's tasks stay in the tier its oldest pending task went to, so a
+# plan change can't put its messages in two partitions drained concurrently.
+# KEYS: route hash, then queue and ready list of every tier (in ARGV[5..] order).
+# ARGV: tier asked for, task, partition, route TTL, tiers...
+_ENQUEUE = """
+local tier = redis.call('hget', KEYS[1], 'tier') or ARGV[1]
+local slot
+for i = 5, #ARGV do
+    if ARGV[i] == tier then slot = i end
+end
+if not slot then
+    tier = ARGV[1]
+    for i = 5, #ARGV do
+        if ARGV[i] == tier then slot = i end
+    end
+end
+redis.call('hset', KEYS[1], 'tier', tier)
+redis.call('hincrby', KEYS[1], 'pending', 1)
+redis.call('expire', KEYS[1], ARGV[4])
+local k = 2 * (slot - 4)
+redis.call('rpush', KEYS[k], ARGV[2])
+redis.call('rpush', KEYS[k + 1], ARGV[3])
+return tier
+"""
+_ROUTE_DONE = """
+if redis.call('exists', KEYS[1]) == 1 and redis.call('hincrby', KEYS[1], 'pending', -1) <= 0 then
+    redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class Overloaded(Exception):
+    """A message was refused before being queued; maps to an HTTP response."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def tier_of(tier: str) -> str:
+    return tier if tier in TIER_WEIGHTS else DEFAULT_TIER
+
+
+def partition_for(chatroom_id: int) -> int:
+    return chatroom_id % QUEUE_PARTITIONS
+
+
+def ready_key(tier: str) -> str:
+    # Partitions with new work are announced here so idle workers can block on them
+    return f"{QUEUE_NAME}:{tier}:ready"
+
+
+def queue_key(tier: str, partition: int) -> str:
+    return f"{QUEUE_NAME}:{tier}:{partition}"
+
+
+def processing_key(tier: str, partition: int) -> str:
+    return f"{QUEUE_NAME}:{tier}:{partition}:processing"
+
+
+def lease_key(tier: str, partition: int) -> str:
+    return f"{QUEUE_NAME}:{tier}:{partition}:lease"
+
+
+def pending_key(user_id: int) -> str:
+    return f"{QUEUE_NAME}:pending:{user_id}"
+
+
+def route_key(chatroom_id: int) -> str:
+    # Tier (and count) of the chatroom's tasks not yet acked
+    return f"{QUEUE_NAME}:route:{chatroom_id}"
+
+
+def over_slo(tier: str, wait: float) -> bool:
+    return wait > QUEUE_WAIT_SLO.get(tier_of(tier), math.inf)
+
+
+async def admit_task(user_id: int, tier: str) -> float:
+    """
+    Count a task against the user's pending limit before it is saved. Returns
+    the tier's current queue wait; raises Overloaded if the user has too many
+    tasks pending or the tier is shedding. Undo with release_task if the task
+    is not enqueued after all.
+    """
+    tier = tier_of(tier)
+    slo = QUEUE_WAIT_SLO.get(tier)
+    # Tiers without an SLO are never shed
+    shed_at = slo * SHED_FACTOR if slo is not None else 1e18
+    keys = [pending_key(user_id)] + [queue_key(tier, partition) for partition in range(QUEUE_PARTITIONS)]
+    status, wait = await redis_client.eval(
+        _ADMIT, len(keys), *keys, USER_PENDING_LIMIT, time.time(), shed_at, PENDING_TTL,
+    )
+    wait = float(wait)
+    if int(status) == 1:
+        raise Overloaded("Too many messages waiting for a reply. Try again once they are answered.", 429, retry_after=5)
+    if int(status) == 2:
+        raise Overloaded("The service is busy. Please try again shortly.", 503, retry_after=math.ceil(wait))
+    return wait
+
+
+async def release_task(user_id: int):
+    if USER_PENDING_LIMIT > 0:
+        await redis_client.eval(_RELEASE, 1, pending_key(user_id))
+
+
+def queue_release(pipe, user_id: int):
+    """Add release_task's command to `pipe` (workers release on ack)."""
+    if USER_PENDING_LIMIT > 0 and user_id is not None:
+        pipe.eval(_RELEASE, 1, pending_key(user_id))
+
+
+def queue_route_done(pipe, chatroom_id: int):
+    """Add the command counting an acked task off its chatroom's route to `pipe`."""
+    if chatroom_id is not None:
+        pipe.eval(_ROUTE_DONE, 1, route_key(chatroom_id))
+
+
+async def enqueue_gemini_task(chatroom_id: int, user_id: int, message_id: int, content: str, stream: bool = False, quota: dict = None, tier: str = None, idempotency_key: str = None):
+    tier = tier_of(tier)
     task = {
         "chatroom_id": chatroom_id,
         "user_id": user_id,
         "message_id": message_id,
-        "content": content
+        "content": content,
+        "enqueued_at": time.time(),
+        "attempts": 0,
+        "tier": tier,
     }
-    await redis_client.rpush(QUEUE_NAME, json.dumps(task))
+    if stream:
+        # The worker relays chunks through app.utils.streams
+        task["stream"] = True
+    if quota:
+        # Handed back to app.utils.quota.refund if the task fails for good
+        task["quota"] = quota
+    if idempotency_key:
+        # The worker stores the final response under the key (app.utils.idempotency)
+        task["idempotency_key"] = idempotency_key
+    partition = partition_for(chatroom_id)
+    keys = [route_key(chatroom_id)]
+    for name in TIERS:
+        keys += [queue_key(name, partition), ready_key(name)]
+    # Returns the tier whose partition got the task
+    return await redis_client.eval(
+        _ENQUEUE, len(keys), *keys, tier, json.dumps(task), partition, PENDING_TTL, *TIERS
+    )
+
+
+async def migrate_legacy_queue() -> int:
+    """Requeue tasks left in the single-list layout; returns how many were moved."""
+    # One worker process moves them; the others start right away
+    if not await redis_client.set(LEGACY_LOCK_KEY, 1, nx=True, ex=60):
+        return 0
+    moved = 0
+    try:
+        # Removed only once requeued, so a crash here can't lose a task
+        while (task_json := await redis_client.lindex(QUEUE_NAME, 0)) is not None:
+            task = json.loads(task_json)
+            await enqueue_gemini_task(task["chatroom_id"], task["user_id"], task["message_id"], task["content"])
+            await redis_client.lpop(QUEUE_NAME)
+            moved += 1
+    finally:
+        await redis_client.delete(LEGACY_LOCK_KEY)
+    return moved
+
+
+@register_collector
+async def collect_queue_depth():
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for tier in TIERS:
+            for partition in range(QUEUE_PARTITIONS):
+                pipe.llen(queue_key(tier, partition))
+                pipe.llen(processing_key(tier, partition))
+        pipe.llen(DEAD_LETTER_KEY)
+        results = await pipe.execute()
+    per_tier = 2 * QUEUE_PARTITIONS
+    for i, tier in enumerate(TIERS):
+        counts = results[i * per_tier:(i + 1) * per_tier]
+        QUEUE_DEPTH.set(sum(counts[0::2]), tier, "pending")
+        QUEUE_DEPTH.set(sum(counts[1::2]), tier, "processing")
+    QUEUE_DEPTH.set(results[-1], "all", "dead")
 
-# You would have a separate worker process that pops from this queue and calls Gemini API asynchronously.
+# Workers consume these partitions with app.utils.worker_engine (see app/utils/gemini_worker.py).
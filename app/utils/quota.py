@@ -0,0 +1,104 @@
+import os
+import time
+from datetime import datetime
+from app.core.redis_client import redis_client
+
+# Per-tier limits on AI messages. "daily" is a fixed allowance per UTC day;
+# "per_minute"/"burst" is a token bucket. Tiers without an entry are unlimited.
+TIER_LIMITS = {
+    "basic": {"daily": int(os.getenv("BASIC_DAILY_LIMIT", "5"))},
+    "pro": {"per_minute": int(os.getenv("PRO_PER_MINUTE_LIMIT", "60")), "burst": int(os.getenv("PRO_BURST_LIMIT", "20"))},
+}
+
+LIMIT_MESSAGES = {
+    "daily": "Daily message limit reached for Basic plan. Upgrade to Pro for more usage.",
+    "bucket": "Too many messages. Please slow down and try again shortly.",
+}
+
+# Check and take one unit in a single round trip, so concurrent requests can't
+# both pass the check
+_RESERVE_DAILY = """
+local used = tonumber(redis.call('get', KEYS[1]) or '0')
+if used >= tonumber(ARGV[1]) then
+    return 0
+end
+if redis.call('incr', KEYS[1]) == 1 then
+    redis.call('expire', KEYS[1], ARGV[2])
+end
+return 1
+"""
+_REFUND_DAILY = """
+if tonumber(redis.call('get', KEYS[1]) or '0') > 0 then
+    return redis.call('decr', KEYS[1])
+end
+return 0
+"""
+_RESERVE_BUCKET = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+-- tostring keeps 14 significant digits, ~50us of an epoch time; refills would drift
+redis.call('hset', KEYS[1], 'tokens', string.format('%.6f', tokens), 'ts', string.format('%.6f', now))
+redis.call('expire', KEYS[1], math.ceil(capacity / rate) + 60)
+return allowed
+"""
+_REFUND_BUCKET = """
+local tokens = tonumber(redis.call('hget', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('hset', KEYS[1], 'tokens', tostring(math.min(tonumber(ARGV[1]), tokens + 1)))
+end
+return 1
+"""
+
+
+def _tier(user) -> str:
+    return (user.subscription or "basic").lower()
+
+
+async def reserve_message(user):
+    """
+    Take one message from the user's allowance. Returns a reservation (a dict
+    that can travel with the task, for `refund`) or None if over the limit.
+    """
+    tier = _tier(user)
+    limits = TIER_LIMITS.get(tier)
+    if not limits:
+        return {"tier": tier, "kind": None}
+    if "daily" in limits:
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        key = f"usage:{user.id}:{today}"
+        allowed = await redis_client.eval(_RESERVE_DAILY, 1, key, limits["daily"], 86400)
+        kind = "daily"
+    else:
+        key = f"ratelimit:{user.id}"
+        rate = limits["per_minute"] / 60
+        allowed = await redis_client.eval(_RESERVE_BUCKET, 1, key, rate, limits["burst"], time.time())
+        kind = "bucket"
+    if not int(allowed):
+        return None
+    return {"tier": tier, "kind": kind, "key": key}
+
+
+async def refund(reservation: dict):
+    """Give back a reserved message, e.g. when the LLM call failed."""
+    if not reservation or not reservation.get("kind"):
+        return
+    if reservation["kind"] == "daily":
+        await redis_client.eval(_REFUND_DAILY, 1, reservation["key"])
+    else:
+        burst = TIER_LIMITS[reservation["tier"]]["burst"]
+        await redis_client.eval(_REFUND_BUCKET, 1, reservation["key"], burst)
+
+
+def limit_message(user) -> str:
+    limits = TIER_LIMITS.get(_tier(user), {})
+    return LIMIT_MESSAGES["daily" if "daily" in limits else "bucket"]
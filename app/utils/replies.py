@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+from app.core.redis_client import redis_client
+
+# Every finished AI reply is stored under a per-message key (so late waiters can
+# still pick it up) and announced on a single pub/sub channel. Each API process
+# keeps one subscription to that channel and fans notifications out to the
+# requests waiting on them, so waiting costs no DB queries and no extra Redis
+# connections per request. WebSocket connections subscribe to whole chatrooms
+# through the same fan-out.
+REPLY_CHANNEL = "gemini_replies"
+REPLY_KEY = "gemini_reply:{message_id}"
+REPLY_TTL = 300
+
+logger = logging.getLogger(__name__)
+
+
+async def publish_reply(message_id: int, reply: dict):
+    """Store the reply for `message_id` and notify every waiting process."""
+    payload = json.dumps({"message_id": message_id, **reply})
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.setex(REPLY_KEY.format(message_id=message_id), REPLY_TTL, payload)
+        pipe.publish(REPLY_CHANNEL, payload)
+        await pipe.execute()
+
+
+class ReplyListener:
+    """Process-wide fan-out of the reply channel to local waiters."""
+
+    def __init__(self):
+        self._waiters: dict[int, list[asyncio.Future]] = {}
+        self._rooms: dict[int, set[asyncio.Queue]] = {}
+        self._task: asyncio.Task | None = None
+        self._ready: asyncio.Event | None = None
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._ready = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        await self._ready.wait()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(REPLY_CHANNEL)
+                # Wait for the server to confirm the subscription so that no
+                # publish that happens after a waiter's key check can be missed.
+                while True:
+                    msg = await pubsub.get_message(timeout=1.0)
+                    if msg and msg["type"] == "subscribe":
+                        break
+                # Anything published while we were (re)connecting is still in
+                # the reply keys.
+                await self._recheck_pending()
+                self._ready.set()
+                async for msg in pubsub.listen():
+                    if msg["type"] != "message":
+                        continue
+                    self._dispatch(json.loads(msg["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Reply listener disconnected: %s", exc)
+                await asyncio.sleep(0.5)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def _recheck_pending(self):
+        message_ids = list(self._waiters)
+        if not message_ids:
+            return
+        values = await redis_client.mget([REPLY_KEY.format(message_id=m) for m in message_ids])
+        for value in values:
+            if value:
+                self._dispatch(json.loads(value))
+
+    def _dispatch(self, reply: dict):
+        for fut in self._waiters.pop(reply.get("message_id"), []):
+            if not fut.done():
+                fut.set_result(reply)
+        for queue in self._rooms.get(reply.get("chatroom_id"), ()):
+            queue.put_nowait(reply)
+
+    async def subscribe_room(self, chatroom_id: int, queue: asyncio.Queue):
+        """Deliver every reply published for `chatroom_id` to `queue`."""
+        await self.start()
+        self._rooms.setdefault(chatroom_id, set()).add(queue)
+
+    def unsubscribe_room(self, chatroom_id: int, queue: asyncio.Queue):
+        queues = self._rooms.get(chatroom_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._rooms[chatroom_id]
+
+    async def wait(self, message_id: int, timeout: float):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        fut = loop.create_future()
+        self._waiters.setdefault(message_id, []).append(fut)
+        try:
+            # Connecting the subscription counts against the timeout, so an
+            # unreachable Redis ends in the caller's fallback instead of a hang
+            await asyncio.wait_for(self.start(), timeout)
+            # The reply may have been published before we registered.
+            stored = await redis_client.get(REPLY_KEY.format(message_id=message_id))
+            if stored:
+                return json.loads(stored)
+            return await asyncio.wait_for(fut, max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(message_id)
+            if waiters and fut in waiters:
+                waiters.remove(fut)
+                if not waiters:
+                    del self._waiters[message_id]
+
+
+reply_listener = ReplyListener()
+
+
+async def wait_for_reply(message_id: int, timeout: float = 20.0):
+    """Return the AI reply for `message_id`, or None if it isn't ready within `timeout`."""
+    return await reply_listener.wait(message_id, timeout)
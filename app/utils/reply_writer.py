@@ -0,0 +1,58 @@
+import asyncio
+import os
+from sqlalchemy import insert
+from app.core.database import AsyncSessionLocal
+from app.models.message import Message
+
+# Group commit for AI replies: rows written within REPLY_BATCH_DELAY_MS of each
+# other (or REPLY_BATCH_SIZE of them) share one multi-row INSERT and one COMMIT.
+REPLY_BATCH_SIZE = int(os.getenv("REPLY_BATCH_SIZE", "50"))
+REPLY_BATCH_DELAY = float(os.getenv("REPLY_BATCH_DELAY_MS", "5")) / 1000
+
+
+class ReplyWriter:
+    def __init__(self, batch_size: int = REPLY_BATCH_SIZE, delay: float = REPLY_BATCH_DELAY):
+        self.batch_size = batch_size
+        self.delay = delay
+        self._pending = []
+        self._timer = None
+        # Flushes in flight (kept so they aren't garbage collected mid-commit)
+        self._flushes: set[asyncio.Task] = set()
+
+    async def write(self, chatroom_id: int, content: str):
+        """Queue an AI message; returns once the batch holding it is committed."""
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append(({"chatroom_id": chatroom_id, "sender": "ai", "content": content}, fut))
+        if len(self._pending) >= self.batch_size:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.delay, self._flush_now)
+        await fut
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: list):
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(Message).values([row for row, _ in batch]))
+                await db.commit()
+        except Exception as exc:
+            # Every writer in the batch fails; the worker engine retries their tasks
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+        else:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_result(None)
+
+
+reply_writer = ReplyWriter()
@@ -0,0 +1,77 @@
+import contextvars
+import logging
+import os
+import time
+from collections import Counter
+from sqlalchemy import event
+
+# Opt-in per-request SQL profiling (SQL_PROFILE=1): counts statements and DB time
+# per request, flags statements repeated within one request (N+1s: the same SQL
+# with different parameters) and, separately, exact repeats with the same
+# parameters (polling loops, missing caches), and logs slow statements.
+SQL_PROFILE = os.getenv("SQL_PROFILE", "0") == "1"
+SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", "100"))
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "3"))
+
+logger = logging.getLogger("app.sql")
+
+_current_profile = contextvars.ContextVar("sql_profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self, label: str):
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self.calls = Counter()
+
+    def record(self, statement: str, parameters, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+        self.calls[(statement, repr(parameters))] += 1
+
+    def repeated(self) -> list:
+        """(statement, runs) for SQL run SQL_REPEAT_THRESHOLD+ times, whatever the parameters."""
+        return [(stmt, n) for stmt, n in self.statements.items() if n >= SQL_REPEAT_THRESHOLD]
+
+    def duplicated(self) -> list:
+        """(statement, runs) for SQL run SQL_REPEAT_THRESHOLD+ times with the same parameters."""
+        return [(stmt, n) for (stmt, _), n in self.calls.items() if n >= SQL_REPEAT_THRESHOLD]
+
+    def log(self):
+        logger.info("%s: %d statements, %.1f ms in DB", self.label, self.count, self.seconds * 1000)
+        for statement, n in self.repeated():
+            logger.warning("%s: statement ran %d times (N+1?): %s", self.label, n, " ".join(statement.split()))
+        for statement, n in self.duplicated():
+            logger.warning("%s: identical statement and parameters ran %d times: %s", self.label, n, " ".join(statement.split()))
+
+
+def start_profile(label: str):
+    """Start collecting statements for the current request; returns (profile, reset token)."""
+    profile = RequestProfile(label)
+    return profile, _current_profile.set(profile)
+
+
+def end_profile(token):
+    _current_profile.reset(token)
+
+
+def install(engine):
+    """Attach the profiling hooks to an AsyncEngine."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        if elapsed * 1000 >= SQL_SLOW_MS:
+            logger.warning("Slow statement (%.1f ms): %s %r", elapsed * 1000, " ".join(statement.split()), parameters)
+        # SQLAlchemy runs these hooks in a greenlet that shares the request's context
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.record(statement, parameters, elapsed)
@@ -0,0 +1,44 @@
+import json
+from app.core.redis_client import redis_client
+
+# Partial replies travel from the worker to the API through a short-lived Redis
+# Stream per message. Readers start from the beginning of the stream, so they
+# get every chunk no matter when they attach.
+STREAM_KEY = "gemini_stream:{message_id}"
+STREAM_TTL = 300
+STREAM_BLOCK_MS = 1000
+
+
+async def publish_event(message_id: int, event: str, data: dict):
+    key = STREAM_KEY.format(message_id=message_id)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.xadd(key, {"event": event, "data": json.dumps(data)})
+        pipe.expire(key, STREAM_TTL)
+        await pipe.execute()
+
+
+async def relay_events(message_id: int, timeout: float = 20.0):
+    """
+    Yield (event, data) pairs for `message_id` until a "done" or "error" event,
+    or until nothing has arrived for `timeout` seconds.
+    """
+    key = STREAM_KEY.format(message_id=message_id)
+    last_id = "0-0"
+    idle_ms = 0
+    while idle_ms < timeout * 1000:
+        result = await redis_client.xread({key: last_id}, block=STREAM_BLOCK_MS)
+        if not result:
+            idle_ms += STREAM_BLOCK_MS
+            continue
+        idle_ms = 0
+        for entry_id, fields in result[0][1]:
+            last_id = entry_id
+            event = fields["event"]
+            yield event, json.loads(fields["data"])
+            if event in ("done", "error"):
+                return
+    yield "timeout", {"message_id": message_id}
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from sqlalchemy import update
+from app.core.database import AsyncSessionLocal
+from app.core.redis_client import redis_client
+from app.models.user import User
+from app.utils.user import invalidate_users
+
+# Stripe webhooks are acknowledged as soon as the signature checks out: the
+# event is deduplicated by id and appended to a Redis Stream in one round trip.
+# A consumer in every API process (one consumer group, so each event is handled
+# once) reads events in batches, turns them into subscription changes through
+# the handler registry below and applies a whole batch in one transaction.
+# Stripe doesn't deliver events in order, so the `created` time of the last
+# change applied to each user is kept and older events are skipped.
+EVENTS_STREAM = "stripe_events"
+EVENTS_GROUP = "billing"
+EVENT_SEEN_KEY = "stripe_event:{event_id}"
+# Stripe retries deliveries for up to three days
+EVENT_SEEN_TTL = 60 * 60 * 24 * 7
+EVENTS_MAXLEN = 100000
+# mobile -> `created` of the newest event applied to that user
+APPLIED_KEY = "stripe_event_applied"
+STRIPE_EVENT_BATCH = int(os.getenv("STRIPE_EVENT_BATCH", "100"))
+STRIPE_EVENT_CONSUMER = os.getenv("STRIPE_EVENT_CONSUMER", "1") == "1"
+BLOCK_MS = 1000
+# Entries read by a consumer that died are taken over after this long
+CLAIM_IDLE_MS = 60000
+
+_ENQUEUE = """
+if redis.call('set', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+    redis.call('xadd', KEYS[2], 'MAXLEN', '~', ARGV[2], '*', 'event', ARGV[3])
+    return 1
+end
+return 0
+"""
+# ARGV: mobile, created pairs. Keeps (and records) the mobiles whose change is
+# at least as new as the last one applied; equal times pass so that a batch
+# redelivered after a failed apply is applied again.
+_KEEP_NEWER = """
+local kept = {}
+for i = 1, #ARGV, 2 do
+    local applied = tonumber(redis.call('hget', KEYS[1], ARGV[i]) or '-1')
+    if tonumber(ARGV[i + 1]) >= applied then
+        redis.call('hset', KEYS[1], ARGV[i], ARGV[i + 1])
+        table.insert(kept, ARGV[i])
+    end
+end
+return kept
+"""
+
+logger = logging.getLogger(__name__)
+
+# event type -> handler(obj) returning the user's new plan as (mobile, plan),
+# or None when the event needs no change
+HANDLERS = {}
+
+
+def handles(*event_types):
+    def register(fn):
+        for event_type in event_types:
+            HANDLERS[event_type] = fn
+        return fn
+    return register
+
+
+def _mobile(metadata) -> str:
+    return (metadata or {}).get("user_mobile")
+
+
+@handles("checkout.session.completed")
+def _checkout_completed(obj: dict):
+    mobile = _mobile(obj.get("metadata"))
+    return (mobile, "Pro") if mobile else None
+
+
+@handles("invoice.paid")
+def _invoice_paid(obj: dict):
+    # Renewals: keep (or restore) Pro while invoices are being paid
+    mobile = _mobile((obj.get("subscription_details") or {}).get("metadata"))
+    return (mobile, "Pro") if mobile else None
+
+
+@handles("customer.subscription.updated")
+def _subscription_updated(obj: dict):
+    mobile = _mobile(obj.get("metadata"))
+    if not mobile:
+        return None
+    if obj.get("status") in ("active", "trialing"):
+        return mobile, "Pro"
+    if obj.get("status") in ("canceled", "unpaid", "incomplete_expired"):
+        return mobile, "Basic"
+    return None
+
+
+@handles("customer.subscription.deleted")
+def _subscription_deleted(obj: dict):
+    mobile = _mobile(obj.get("metadata"))
+    return (mobile, "Basic") if mobile else None
+
+
+async def enqueue_event(event: dict, payload: str) -> bool:
+    """Queue a verified event unless it was seen before; returns False for duplicates."""
+    if event.get("type") not in HANDLERS:
+        # Nothing to do, so no need to remember it either
+        return True
+    queued = await redis_client.eval(
+        _ENQUEUE, 2, EVENT_SEEN_KEY.format(event_id=event["id"]), EVENTS_STREAM,
+        EVENT_SEEN_TTL, EVENTS_MAXLEN, payload,
+    )
+    return bool(queued)
+
+
+def plan_changes(events: list[dict]) -> dict:
+    """mobile -> (plan, created) after `events`; the most recently created event wins."""
+    latest = {}
+    for event in sorted(events, key=lambda e: e.get("created", 0)):
+        try:
+            change = HANDLERS[event["type"]](event["data"]["object"])
+        except Exception:
+            logger.exception("Skipping malformed Stripe event %s", event.get("id"))
+            continue
+        if change:
+            mobile, plan = change
+            latest[str(mobile)] = (plan, event.get("created", 0))
+    return latest
+
+
+async def drop_stale(changes: dict) -> dict:
+    """mobile -> plan for the changes newer than what was applied in earlier batches."""
+    if not changes:
+        return {}
+    args = [item for mobile, (_, created) in changes.items() for item in (mobile, created)]
+    kept = await redis_client.eval(_KEEP_NEWER, 1, APPLIED_KEY, *args)
+    return {mobile: changes[mobile][0] for mobile in kept}
+
+
+async def apply_changes(changes: dict):
+    if not changes:
+        return
+    by_plan = {}
+    for mobile, plan in changes.items():
+        by_plan.setdefault(plan, []).append(mobile)
+    async with AsyncSessionLocal() as db:
+        for plan, mobiles in by_plan.items():
+            await db.execute(update(User).where(User.mobile.in_(mobiles)).values(subscription=plan))
+        await db.commit()
+    await invalidate_users(list(changes))
+
+
+class EventConsumer:
+    """Background task applying queued Stripe events in batches."""
+
+    def __init__(self):
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+        self._task: asyncio.Task | None = None
+        self._last_claim = 0.0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _ensure_group(self):
+        try:
+            await redis_client.xgroup_create(EVENTS_STREAM, EVENTS_GROUP, id="0", mkstream=True)
+        except Exception as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+    async def _run(self):
+        group_ready = False
+        while True:
+            try:
+                if not group_ready:
+                    await self._ensure_group()
+                    group_ready = True
+                entries = []
+                # Now and then, take over entries of consumers that died mid-batch
+                if time.monotonic() - self._last_claim > CLAIM_IDLE_MS / 2000:
+                    self._last_claim = time.monotonic()
+                    _, entries, *_ = await redis_client.xautoclaim(
+                        EVENTS_STREAM, EVENTS_GROUP, self.name, CLAIM_IDLE_MS, start_id="0-0", count=STRIPE_EVENT_BATCH
+                    )
+                if not entries:
+                    result = await redis_client.xreadgroup(
+                        EVENTS_GROUP, self.name, {EVENTS_STREAM: ">"}, count=STRIPE_EVENT_BATCH, block=BLOCK_MS
+                    )
+                    entries = result[0][1] if result else []
+                if entries:
+                    await self._handle(entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # Unacked entries are claimed again after CLAIM_IDLE_MS
+                logger.warning("Stripe event consumer error: %s", exc)
+                await asyncio.sleep(1)
+
+    async def _handle(self, entries: list):
+        # Claimed entries that were trimmed from the stream come back without fields
+        events = [json.loads(fields["event"]) for _, fields in entries if fields]
+        await apply_changes(await drop_stale(plan_changes(events)))
+        await redis_client.xack(EVENTS_STREAM, EVENTS_GROUP, *[entry_id for entry_id, _ in entries])
+
+
+consumer = EventConsumer()
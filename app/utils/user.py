@@ -1,11 +1,100 @@
+import os
 from fastapi import Request, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from app.core.redis_client import redis_client
 from app.models.user import User
+from app.utils.cache import TTLCache
 from app.utils.db import get_db
 
+# Two tiers: a short-lived per-process cache in front of a Redis hash per user.
+# The near cache TTL bounds how long other processes may serve a user that was
+# just invalidated. Every invalidation bumps the user's generation; a reader
+# only stores the row it loaded if the generation is still the one it saw
+# before the SELECT, so a row read just before a change can't be cached after
+# the invalidation.
+USER_KEY = "user:{mobile}"
+USER_GEN_KEY = "user:{mobile}:gen"
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "3600"))
+USER_NEAR_CACHE_TTL = float(os.getenv("USER_NEAR_CACHE_TTL", "5"))
+USER_NEAR_CACHE_SIZE = int(os.getenv("USER_NEAR_CACHE_SIZE", "10000"))
+
+_near_cache = TTLCache(maxsize=USER_NEAR_CACHE_SIZE, ttl=USER_NEAR_CACHE_TTL)
+
+_STORE_IF_CURRENT = """
+if (redis.call('get', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('hset', KEYS[1], unpack(ARGV, 3))
+redis.call('expire', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+async def _load_user_fields(mobile, db: AsyncSession):
+    key = USER_KEY.format(mobile=mobile)
+    gen_key = USER_GEN_KEY.format(mobile=mobile)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hgetall(key)
+        pipe.get(gen_key)
+        cached, generation = await pipe.execute()
+    if cached:
+        return {
+            "id": int(cached["id"]),
+            "mobile": cached["mobile"],
+            "name": cached.get("name"),
+            "subscription": cached["subscription"],
+        }
+    # password_hash is deliberately not cached; change_password reads it itself
+    result = await db.execute(
+        select(User.id, User.mobile, User.name, User.subscription).where(User.mobile == mobile)
+    )
+    row = result.first()
+    if not row:
+        return None
+    fields = dict(row._mapping)
+    pairs = [item for k, v in fields.items() if v is not None for item in (k, v)]
+    await redis_client.eval(_STORE_IF_CURRENT, 2, key, gen_key, generation or "0", USER_CACHE_TTL, *pairs)
+    return fields
+
+
 async def get_current_user(request: Request, db: AsyncSession = Depends(get_db)):
     mobile = getattr(request.state, "user_mobile", None)
-    result = await db.execute(select(User).where(User.mobile == mobile))
-    user = result.scalars().first()
-    return user
+    if mobile is None:
+        return None
+    return await load_user(mobile, db)
+
+
+async def load_user(mobile, db: AsyncSession):
+    """Return the (cached) user with this mobile, or None."""
+    mobile = str(mobile)
+    fields = _near_cache.get(mobile)
+    if fields is None:
+        fields = await _load_user_fields(mobile, db)
+        if fields is None:
+            return None
+        _near_cache.set(mobile, fields)
+    # A detached User: fine for reading, use explicit UPDATEs to change it
+    return User(**fields)
+
+
+async def invalidate_user(mobile):
+    """Drop cached state for a user after their row changes."""
+    await invalidate_users([mobile])
+
+
+async def invalidate_users(mobiles: list):
+    """invalidate_user for many users in one round trip."""
+    mobiles = [str(mobile) for mobile in mobiles]
+    for mobile in mobiles:
+        _near_cache.pop(mobile)
+    if not mobiles:
+        return
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for mobile in mobiles:
+            gen_key = USER_GEN_KEY.format(mobile=mobile)
+            pipe.incr(gen_key)
+            # Outlives any read that started before this bump
+            pipe.expire(gen_key, USER_CACHE_TTL)
+            pipe.delete(USER_KEY.format(mobile=mobile))
+        await pipe.execute()
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from app.core.redis_client import redis_client
+from app.utils.metrics import TASK_AGE, TASKS
+from app.utils.queue import (
+    QUEUE_PARTITIONS, DEAD_LETTER_KEY, TIER_WEIGHTS,
+    ready_key, queue_key, processing_key, lease_key, queue_release, queue_route_done,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = int(os.getenv("GEMINI_TASK_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF = float(os.getenv("GEMINI_TASK_RETRY_BACKOFF", "0.5"))  # seconds, doubled per attempt
+RETRY_BACKOFF_MAX = 10.0
+LEASE_TTL_MS = int(os.getenv("GEMINI_PARTITION_LEASE_MS", "30000"))
+# Tasks drained from one partition before it is handed back, so busy chatrooms
+# can't keep a worker to themselves
+MAX_BATCH = int(os.getenv("GEMINI_PARTITION_MAX_BATCH", "50"))
+READY_BLOCK = 1  # seconds an idle worker blocks on the ready list
+SWEEP_INTERVAL = 5.0  # seconds between scans for partitions nobody announced
+
+# Only touch the lease if we still own it
+_RELEASE_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+_RENEW_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class WorkerEngine:
+    """
+    Runs `handler(task)` for queued Gemini tasks with `concurrency` slots.
+
+    Idle slots block on the ready lists of all tiers at once. The order of the
+    lists is rotated by smooth weighted round robin over `tiers` (tier ->
+    weight), and BLPOP serves the first non-empty list, so a busy tier gets its
+    share of partitions but cannot starve the others.
+    Each slot owns at most one partition at a time (through a Redis lease), so
+    tasks of a chatroom run in order while several processes can run engines
+    side by side. A task is moved to the partition's processing list before it
+    is handled and removed only after `handler` returns, so a crash never loses
+    it: the next owner of the partition runs it again. Failing tasks are retried
+    with exponential backoff and, once `max_attempts` is reached, moved to the
+    dead-letter list and passed to `on_dead(task, exc)`.
+    """
+
+    def __init__(self, handler, concurrency: int = 4, on_dead=None, redis=None,
+                 partitions: int = QUEUE_PARTITIONS, max_attempts: int = MAX_ATTEMPTS, tiers: dict = None):
+        self.handler = handler
+        self.on_dead = on_dead
+        self.concurrency = concurrency
+        self.redis = redis or redis_client
+        self.partitions = partitions
+        self.max_attempts = max_attempts
+        self.tiers = dict(tiers or TIER_WEIGHTS)
+        self._credit = {tier: 0 for tier in self.tiers}
+        self._tier_by_ready_key = {ready_key(tier): tier for tier in self.tiers}
+        self.name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._stopping = asyncio.Event()
+        self._last_sweep = 0.0
+
+    async def run(self):
+        logger.info("Worker engine %s starting %d slots", self.name, self.concurrency)
+        try:
+            await self._sweep()
+        except Exception as exc:
+            # Idle slots sweep again once Redis is back
+            logger.warning("Initial sweep failed: %s", exc)
+        await asyncio.gather(*(self._slot(i) for i in range(self.concurrency)))
+
+    def stop(self):
+        self._stopping.set()
+
+    def _ready_keys(self) -> list:
+        # Smooth weighted round robin: the tier with the most credit goes first
+        for tier, weight in self.tiers.items():
+            self._credit[tier] += weight
+        first = max(self._credit, key=self._credit.get)
+        self._credit[first] -= sum(self.tiers.values())
+        rest = sorted((t for t in self.tiers if t != first), key=self._credit.get, reverse=True)
+        return [ready_key(tier) for tier in [first, *rest]]
+
+    async def _slot(self, index: int):
+        token = f"{self.name}:{index}"
+        failures = 0
+        while not self._stopping.is_set():
+            try:
+                await self._poll(token)
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # Redis went away mid-step: a task we took stays in its processing
+                # list and our lease expires, so whoever drains the partition next
+                # runs it again. Keep the slot alive and back off until Redis is back.
+                failures += 1
+                delay = min(RETRY_BACKOFF * 2 ** (failures - 1), RETRY_BACKOFF_MAX)
+                logger.warning("Worker slot %s failed, retrying in %.1fs: %s", token, delay, exc)
+                await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+    async def _poll(self, token: str):
+        """Take one announced partition and drain it, or sweep when idle."""
+        ready = await self.redis.blpop(self._ready_keys(), timeout=READY_BLOCK)
+        if ready is None:
+            if time.monotonic() - self._last_sweep > SWEEP_INTERVAL:
+                await self._sweep()
+            return
+        tier, partition = self._tier_by_ready_key[ready[0]], int(ready[1])
+        acquired = await self.redis.set(lease_key(tier, partition), token, nx=True, px=LEASE_TTL_MS)
+        if not acquired:
+            # Someone else is draining it and will pick this task up as well
+            return
+        try:
+            await self._drain(tier, partition, token)
+        except LeaseLost:
+            logger.warning("Lost lease on %s partition %d", tier, partition)
+        finally:
+            await self.redis.eval(_RELEASE_LEASE, 1, lease_key(tier, partition), token)
+        # A task may have arrived after our last read but before the release
+        if await self.redis.llen(queue_key(tier, partition)):
+            await self.redis.rpush(ready_key(tier), partition)
+
+    async def _drain(self, tier: str, partition: int, token: str):
+        lost = asyncio.Event()
+        heartbeat = asyncio.create_task(self._heartbeat(tier, partition, token, lost))
+        try:
+            # Tasks left by an owner that died mid-task come first
+            for task_json in await self.redis.lrange(processing_key(tier, partition), 0, -1):
+                await self._handle(tier, partition, task_json, lost)
+            for _ in range(MAX_BATCH):
+                if lost.is_set():
+                    raise LeaseLost()
+                task_json = await self.redis.lmove(queue_key(tier, partition), processing_key(tier, partition), "LEFT", "RIGHT")
+                if task_json is None:
+                    return
+                await self._handle(tier, partition, task_json, lost)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, tier: str, partition: int, token: str, lost: asyncio.Event):
+        while True:
+            await asyncio.sleep(LEASE_TTL_MS / 3000)
+            try:
+                renewed = await self.redis.eval(_RENEW_LEASE, 1, lease_key(tier, partition), token, LEASE_TTL_MS)
+            except Exception as exc:
+                # Try again next beat; if Redis stays away the lease expires and
+                # the next renewal reports it lost
+                logger.warning("Could not renew lease on %s partition %d: %s", tier, partition, exc)
+                continue
+            if not renewed:
+                lost.set()
+                return
+
+    async def _handle(self, tier: str, partition: int, task_json: str, lost: asyncio.Event):
+        task = json.loads(task_json)
+        wait = time.time() - task.get("enqueued_at", time.time())
+        TASK_AGE.observe(wait, tier)
+        attempts = task.get("attempts", 0)
+        while True:
+            try:
+                await self.handler(task)
+                TASKS.inc("ok")
+                break
+            except Exception as exc:
+                attempts += 1
+                task["attempts"] = attempts
+                if attempts >= self.max_attempts:
+                    TASKS.inc("dead")
+                    logger.error("Task %s failed %d times, dead-lettering: %s", task.get("message_id"), attempts, exc)
+                    await self._dead_letter(task, exc)
+                    break
+                TASKS.inc("retry")
+                delay = min(RETRY_BACKOFF * 2 ** (attempts - 1), RETRY_BACKOFF_MAX)
+                logger.warning("Task %s failed (attempt %d), retrying in %.1fs: %s", task.get("message_id"), attempts, delay, exc)
+                await asyncio.sleep(delay * (0.5 + random.random() / 2))
+                if lost.is_set():
+                    # The task stays in the processing list for the next owner
+                    raise LeaseLost()
+        # Ack and release the user's pending slot and the chatroom's tier route
+        # in one round trip
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.lrem(processing_key(tier, partition), 1, task_json)
+            queue_release(pipe, task.get("user_id"))
+            queue_route_done(pipe, task.get("chatroom_id"))
+            await pipe.execute()
+
+    async def _dead_letter(self, task: dict, exc: Exception):
+        await self.redis.rpush(DEAD_LETTER_KEY, json.dumps({**task, "error": str(exc), "failed_at": time.time()}))
+        if self.on_dead is not None:
+            try:
+                await self.on_dead(task, exc)
+            except Exception:
+                logger.exception("on_dead hook failed for task %s", task.get("message_id"))
+
+    async def _sweep(self):
+        """Announce partitions with work but no owner (lost announcements, crashed owners)."""
+        self._last_sweep = time.monotonic()
+        slots = [(tier, partition) for tier in self.tiers for partition in range(self.partitions)]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for tier, partition in slots:
+                pipe.llen(queue_key(tier, partition))
+                pipe.llen(processing_key(tier, partition))
+                pipe.exists(lease_key(tier, partition))
+            results = await pipe.execute()
+        for i, (tier, partition) in enumerate(slots):
+            pending, in_flight, leased = results[i * 3:i * 3 + 3]
+            if (pending or in_flight) and not leased:
+                await self.redis.rpush(ready_key(tier), partition)
@@ -0,0 +1,90 @@
+"""
+Latency of an unrelated endpoint during a burst of signups.
+
+    python -m benchmarks.bcrypt_storm --signups 64 --concurrency 16
+
+A small app exposes a signup-like endpoint that hashes a password, once with
+bcrypt inline on the event loop (as auth.py used to) and once through
+app.utils.passwords, plus a trivial /ping. While signups are in flight /ping is
+called continuously; its p50/p99 are printed for both modes.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.utils import passwords
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/signup-inline")
+    async def signup_inline():
+        passwords.pwd_context.hash("correct horse battery staple")
+        return {"success": True}
+
+    @app.post("/signup-pool")
+    async def signup_pool():
+        await passwords.hash_password("correct horse battery staple")
+        return {"success": True}
+
+    @app.get("/ping")
+    async def ping():
+        return {"success": True}
+
+    return app
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def storm(client, path: str, signups: int, concurrency: int):
+    latencies = []
+    remaining = signups
+    stop = asyncio.Event()
+
+    async def signer():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await client.post(path)
+
+    async def pinger():
+        while not stop.is_set():
+            start = time.perf_counter()
+            await client.get("/ping")
+            latencies.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0.005)
+
+    ping_task = asyncio.create_task(pinger())
+    await asyncio.gather(*(signer() for _ in range(concurrency)))
+    stop.set()
+    await ping_task
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--signups", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Start the pool outside the measurement
+        await passwords.hash_password("warmup")
+        for mode in ("inline", "pool"):
+            latencies = await storm(client, f"/signup-{mode}", args.signups, args.concurrency)
+            print(f"{mode:<7} bcrypt: /ping n={len(latencies):<5} p50={statistics.median(latencies):8.2f}ms "
+                  f"p99={percentile(latencies, 99):8.2f}ms max={max(latencies):8.2f}ms")
+    passwords.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""
+Chat latency while checkout sessions are being created.
+
+    python -m benchmarks.checkout_burst --checkouts 200 --stripe-latency-ms 300
+
+Runs the API in-process against the local Stripe stub (benchmarks.stripe_stub)
+and keeps a steady stream of chat requests (POST /chatroom/{id}/message and
+GET /chatroom/) going while a burst of checkouts runs, in three modes:
+- none: no checkouts (baseline)
+- sdk: checkouts through the synchronous Stripe SDK, as subscribe.py used to
+- async: POST /subscribe/pro, i.e. app.utils.billing over pooled httpx
+Prints a JSON report with chat p50/p99 per mode.
+"""
+import argparse
+import asyncio
+import json
+import os
+
+from benchmarks.harness import Recorder, bootstrap, create_user, git_revision, running_app
+
+
+def add_sdk_route(app):
+    from app.utils.billing import get_stripe
+
+    @app.post("/bench/checkout-sdk")
+    async def checkout_sdk():
+        session = get_stripe().checkout.Session.create(
+            payment_method_types=["card"],
+            line_items=[{"price": "price_bench", "quantity": 1}],
+            mode="subscription",
+            success_url="http://localhost/success",
+            cancel_url="http://localhost/cancel",
+        )
+        return {"success": True, "checkout_url": session.url}
+
+
+async def run_mode(client, mode: str, args, chat_users, payer_headers) -> dict:
+    rec = Recorder()
+    stop = asyncio.Event()
+
+    async def chatter(chatroom_id, headers):
+        n = 0
+        while not stop.is_set():
+            await rec.call(client, "POST /chatroom/{id}/message", "POST", f"/chatroom/{chatroom_id}/message",
+                           json={"content": f"{mode} {n}"}, headers=headers)
+            await rec.call(client, "GET /chatroom/", "GET", "/chatroom/", headers=headers)
+            n += 1
+
+    async def checkouts():
+        if mode == "none":
+            await asyncio.sleep(args.baseline_s)
+            return
+        path = "/bench/checkout-sdk" if mode == "sdk" else "/subscribe/pro"
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one():
+            async with semaphore:
+                await rec.call(client, "checkout", "POST", path, headers=payer_headers)
+
+        await asyncio.gather(*(one() for _ in range(args.checkouts)))
+
+    chatters = [asyncio.create_task(chatter(*user)) for user in chat_users]
+    await checkouts()
+    stop.set()
+    await asyncio.gather(*chatters)
+    return rec.report()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkouts", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent checkouts")
+    parser.add_argument("--chat-users", type=int, default=10)
+    parser.add_argument("--stripe-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-latency-ms", type=float, default=20)
+    parser.add_argument("--baseline-s", type=float, default=3.0)
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--modes", default="none,sdk,async")
+    args = parser.parse_args()
+
+    from benchmarks.stripe_stub import serve_in_thread
+    stub = serve_in_thread(args.port, args.stripe_latency_ms)
+    stub_url = f"http://127.0.0.1:{args.port}"
+    os.environ["STRIPE_API_BASE"] = stub_url
+    os.environ.setdefault("STRIPE_API_KEY", "sk_test_bench")
+    app = bootstrap(llm_latency_ms=args.llm_latency_ms)
+    from app.utils.billing import get_stripe
+    get_stripe().api_base = stub_url
+    add_sdk_route(app)
+
+    report = {"revision": git_revision(), "params": vars(args), "modes": {}}
+    async with running_app(app, workers=8) as client:
+        chat_users = []
+        for i in range(args.chat_users):
+            _, headers = await create_user(str(15000000000 + i), subscription="Pro")
+            response = await client.post("/chatroom/", json={"name": "bench"}, headers=headers)
+            chat_users.append((response.json()["chatroom_id"], headers))
+        _, payer_headers = await create_user("15999999999")
+        for mode in args.modes.split(","):
+            report["modes"][mode] = await run_mode(client, mode, args, chat_users, payer_headers)
+    stub.should_exit = True
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""
+Prompt size and LLM latency as a chatroom grows, per context strategy.
+
+    python -m benchmarks.context_size --turns 200 --latency-ms 20 --latency-per-kb-ms 5
+
+Plays one long conversation per strategy against the fake LLM, whose latency
+grows with prompt size (--latency-per-kb-ms):
+- last: only the newest user message (what the worker used to send)
+- full: the whole chatroom history
+- rolling: app.utils.context, a rolling summary plus a token-budgeted window
+Prints mean prompt bytes and LLM latency per block of turns, and the total
+bytes sent to the LLM including summary refreshes.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from benchmarks.harness import bootstrap, git_revision
+
+
+async def play(strategy: str, index: int, args) -> dict:
+    from app.core.database import AsyncSessionLocal
+    from app.models.chatroom import Chatroom
+    from app.models.message import Message
+    from app.models.user import User
+    from app.utils import context
+    from app.utils.gemini_worker import save_reply
+    from app.utils.history import fetch_turns, record_turn
+    from app.utils.llm import FakeBackend, compose_prompt, set_backend
+
+    backend = FakeBackend(latency=args.latency_ms / 1000, latency_per_kb=args.latency_per_kb_ms / 1000)
+    set_backend(backend)
+    async with AsyncSessionLocal() as db:
+        user = User(mobile=str(14200000000 + index), name="bench")
+        db.add(user)
+        await db.flush()
+        chatroom = Chatroom(name=strategy, user_id=user.id)
+        db.add(chatroom)
+        await db.commit()
+        chatroom_id = chatroom.id
+
+    blocks = []
+    sizes, latencies = [], []
+    for turn in range(1, args.turns + 1):
+        content = f"Question {turn}: " + "tell me more about the plan " * args.words
+        async with AsyncSessionLocal() as db:
+            message = Message(chatroom_id=chatroom_id, sender="user", content=content)
+            db.add(message)
+            await db.commit()
+        await record_turn(chatroom_id, message.id, "user", content)
+
+        if strategy == "last":
+            messages = [{"role": "user", "content": content}]
+        elif strategy == "full":
+            turns = list(reversed(await fetch_turns(chatroom_id, limit=10 ** 9)))
+            messages = [{"role": "user" if t["sender"] == "user" else "model", "content": t["content"]} for t in turns]
+        else:
+            messages = await context.build_context(chatroom_id, message.id)
+
+        sizes.append(len(compose_prompt(messages).encode()))
+        start = time.perf_counter()
+        reply = await backend.generate(messages)
+        latencies.append((time.perf_counter() - start) * 1000)
+        await save_reply(chatroom_id, message.id, reply)
+        if strategy == "rolling":
+            await context.after_reply(chatroom_id)
+
+        if turn % args.block == 0:
+            blocks.append({
+                "turns": turn,
+                "prompt_bytes": round(statistics.mean(sizes)),
+                "llm_ms": round(statistics.mean(latencies), 2),
+            })
+            sizes, latencies = [], []
+    await asyncio.gather(*context._refreshes)
+    return {"blocks": blocks, "llm_calls": backend.calls, "llm_bytes_total": backend.prompt_bytes}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--block", type=int, default=25, help="turns per reported block")
+    parser.add_argument("--words", type=int, default=10, help="repetitions of filler per question")
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--latency-per-kb-ms", type=float, default=5)
+    parser.add_argument("--strategies", default="last,full,rolling")
+    args = parser.parse_args()
+
+    bootstrap()
+    from app.core.schema import create_schema
+    await create_schema()
+    report = {"revision": git_revision(), "params": vars(args), "strategies": {}}
+    for index, strategy in enumerate(args.strategies.split(",")):
+        report["strategies"][strategy] = await play(strategy, index, args)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""
+In-process harness for driving app.main:app without MySQL, Redis or Gemini.
+
+`bootstrap()` must run before anything under `app` is imported: it points
+DATABASE_URL at a throwaway aiosqlite file, swaps the shared Redis client for
+fakeredis and selects the fake LLM backend.
+"""
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+
+def bootstrap(llm_latency_ms: float = 0, db_path: str = None):
+    db_path = db_path or os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(llm_latency_ms)
+    # Load generators shouldn't trip the per-user limits
+    os.environ.setdefault("BASIC_DAILY_LIMIT", "1000000")
+    os.environ.setdefault("PRO_PER_MINUTE_LIMIT", "1000000")
+    os.environ.setdefault("PRO_BURST_LIMIT", "1000000")
+    # fakeredis answers a blocking XREADGROUP without yielding, which would
+    # stall the event loop; no benchmark drives Stripe webhooks
+    os.environ.setdefault("STRIPE_EVENT_CONSUMER", "0")
+
+    import fakeredis
+    import app.core.redis_client as redis_module
+    redis_module.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    from app.main import app
+    return app
+
+
+@asynccontextmanager
+async def running_app(app, workers: int = 0):
+    """Run the app's startup/shutdown hooks and, optionally, an in-process Gemini worker."""
+    import asyncio
+    import httpx
+    from app.utils.gemini_worker import process_task, on_dead_task
+    from app.utils.worker_engine import WorkerEngine
+
+    async with app.router.lifespan_context(app):
+        engine = None
+        worker = None
+        if workers:
+            engine = WorkerEngine(process_task, concurrency=workers, on_dead=on_dead_task)
+            worker = asyncio.create_task(engine.run())
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            try:
+                yield client
+            finally:
+                if engine is not None:
+                    engine.stop()
+                    await worker
+
+
+async def create_user(mobile: str, subscription: str = "Basic") -> tuple:
+    """Insert a user directly and return (user_id, bearer headers)."""
+    from app.core.database import AsyncSessionLocal
+    from app.models.user import User
+    from app.utils.jwt import create_access_token
+
+    async with AsyncSessionLocal() as db:
+        user = User(mobile=mobile, name="bench", subscription=subscription)
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+    token = create_access_token({"sub": mobile})
+    return user_id, {"Authorization": f"Bearer {token}"}
+
+
+class Recorder:
+    """Collects latencies per route label and summarises them."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.started = time.perf_counter()
+
+    async def call(self, client, label: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[label].append((time.perf_counter() - start) * 1000)
+        self.statuses[label][response.status_code] += 1
+        return response
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        routes = {}
+        for label, values in self.latencies.items():
+            ordered = sorted(values)
+            routes[label] = {
+                "count": len(values),
+                "req_per_s": round(len(values) / elapsed, 2),
+                "p50_ms": round(statistics.median(ordered), 3),
+                "p95_ms": round(percentile(ordered, 95), 3),
+                "p99_ms": round(percentile(ordered, 99), 3),
+                "statuses": dict(self.statuses[label]),
+            }
+        return {"duration_s": round(elapsed, 3), "routes": routes}
+
+
+def percentile(ordered: list, pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
@@ -0,0 +1,153 @@
+"""
+End-to-end load benchmark of the API and the Gemini worker, fully offline.
+
+    python -m benchmarks.load --users 50 --concurrency 20 --llm-latency-ms 50 --output bench.json
+
+Scenarios (select with --scenarios):
+- auth: signup -> send-otp -> verify-otp -> /user/me
+- churn: create chatrooms, list them and fetch them
+- messages: bursts of POST /chatroom/{id}/message answered by an in-process worker
+- export: GET /user/me/export of users with --export-messages messages each
+
+Prints (or writes) a JSON report with req/s and p50/p95/p99 per route, tagged
+with the current git revision so runs can be compared across commits.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.harness import Recorder, bootstrap, create_user, git_revision, running_app
+
+
+async def gather_limited(concurrency: int, jobs):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(job):
+        async with semaphore:
+            await job
+
+    await asyncio.gather(*(run(job) for job in jobs))
+
+
+async def scenario_auth(client, args) -> dict:
+    rec = Recorder()
+
+    async def flow(i: int):
+        mobile = 17000000000 + i
+        await rec.call(client, "POST /auth/signup", "POST", "/auth/signup",
+                       json={"mobile": mobile, "name": f"user{i}", "password": "password123"})
+        response = await rec.call(client, "POST /auth/send-otp", "POST", "/auth/send-otp", json={"mobile": mobile})
+        otp = response.json().get("otp", "0000")
+        response = await rec.call(client, "POST /auth/verify-otp", "POST", "/auth/verify-otp",
+                                  json={"mobile": mobile, "otp": otp})
+        token = response.json().get("access_token", "")
+        await rec.call(client, "GET /user/me", "GET", "/user/me", headers={"Authorization": f"Bearer {token}"})
+
+    await gather_limited(args.concurrency, [flow(i) for i in range(args.users)])
+    return rec.report()
+
+
+async def scenario_churn(client, args) -> dict:
+    users = [await create_user(str(18000000000 + i)) for i in range(args.users)]
+    rec = Recorder()
+
+    async def churn(headers):
+        for n in range(args.rounds):
+            response = await rec.call(client, "POST /chatroom/", "POST", "/chatroom/", json={"name": f"room{n}"}, headers=headers)
+            chatroom_id = response.json()["chatroom_id"]
+            for _ in range(3):
+                await rec.call(client, "GET /chatroom/", "GET", "/chatroom/", headers=headers)
+            await rec.call(client, "GET /chatroom/{id}", "GET", f"/chatroom/{chatroom_id}", headers=headers)
+
+    await gather_limited(args.concurrency, [churn(headers) for _, headers in users])
+    return rec.report()
+
+
+async def scenario_messages(client, args) -> dict:
+    rooms = []
+    for i in range(args.users):
+        _, headers = await create_user(str(19000000000 + i), subscription="Pro")
+        response = await client.post("/chatroom/", json={"name": "bench"}, headers=headers)
+        rooms.append((response.json()["chatroom_id"], headers))
+    rec = Recorder()
+
+    async def burst(chatroom_id, headers):
+        for n in range(args.rounds):
+            await rec.call(client, "POST /chatroom/{id}/message", "POST", f"/chatroom/{chatroom_id}/message",
+                           json={"content": f"hello {n}"}, headers=headers)
+        await rec.call(client, "GET /chatroom/{id}/messages", "GET", f"/chatroom/{chatroom_id}/messages", headers=headers)
+
+    await gather_limited(args.concurrency, [burst(*room) for room in rooms])
+    return rec.report()
+
+
+async def scenario_export(client, args) -> dict:
+    from sqlalchemy import insert
+    from app.core.database import AsyncSessionLocal
+    from app.models.message import Message
+
+    users = []
+    per_room = max(1, args.export_messages // 10)
+    for i in range(max(1, args.users // 10)):
+        _, headers = await create_user(str(16000000000 + i))
+        for _ in range(10):
+            response = await client.post("/chatroom/", json={"name": "export"}, headers=headers)
+            chatroom_id = response.json()["chatroom_id"]
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(Message).values([
+                    {"chatroom_id": chatroom_id, "sender": "user" if n % 2 else "ai", "content": f"message {n} " * 8}
+                    for n in range(per_room)
+                ]))
+                await db.commit()
+        users.append(headers)
+    rec = Recorder()
+    lines = size = 0
+
+    async def export(headers):
+        nonlocal lines, size
+        start = time.perf_counter()
+        async with client.stream("GET", "/user/me/export", headers=headers) as response:
+            async for line in response.aiter_lines():
+                lines += 1
+                size += len(line) + 1
+        rec.latencies["GET /user/me/export"].append((time.perf_counter() - start) * 1000)
+        rec.statuses["GET /user/me/export"][response.status_code] += 1
+
+    await gather_limited(args.concurrency, [export(headers) for headers in users])
+    report = rec.report()
+    report["lines_per_s"] = round(lines / report["duration_s"], 1)
+    report["mb_per_s"] = round(size / report["duration_s"] / 1e6, 2)
+    return report
+
+
+SCENARIOS = {"auth": scenario_auth, "churn": scenario_churn, "messages": scenario_messages, "export": scenario_export}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=8, help="worker slots for the messages scenario")
+    parser.add_argument("--export-messages", type=int, default=10000, help="messages per user for the export scenario")
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    app = bootstrap(llm_latency_ms=args.llm_latency_ms)
+    report = {"revision": git_revision(), "params": vars(args), "scenarios": {}}
+    async with running_app(app, workers=args.workers) as client:
+        for name in args.scenarios.split(","):
+            report["scenarios"][name] = await SCENARIOS[name](client, args)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
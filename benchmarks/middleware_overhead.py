@@ -0,0 +1,131 @@
+"""
+Per-request overhead of the auth/error middleware stack.
+
+    python -m benchmarks.middleware_overhead --requests 20000
+
+Drives a trivial Starlette app directly over ASGI (no network, no server) with
+the previous BaseHTTPMiddleware stack and with the current pure ASGI stack, on
+an authenticated route and on a public route, and prints microseconds per
+request for each.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import time
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from jose import JWTError, jwt
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.routing import Route
+
+from app.middleware import PUBLIC_PATHS, JWTAuthMiddleware, ErrorHandlerMiddleware
+from app.utils.jwt import ALGORITHM, SECRET_KEY, create_access_token
+
+
+# The stack as it was before it was rewritten as plain ASGI middleware
+def _legacy_verify_access_token(token: str):
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+
+class LegacyJWTAuthMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        for path, method in PUBLIC_PATHS:
+            if request.url.path.startswith(path) and (method is None or request.method == method):
+                return await call_next(request)
+        auth_header = request.headers.get("authorization", None)
+        print("Authorization Header:")
+        if not auth_header or not auth_header.lower().startswith("bearer "):
+            return JSONResponse(status_code=401, content={"success": False, "message": "Missing or invalid Authorization header"})
+        parts = auth_header.split(" ", 1)
+        if len(parts) != 2 or not parts[1].strip():
+            return JSONResponse(status_code=401, content={"success": False, "message": "Malformed Authorization header"})
+        payload = _legacy_verify_access_token(parts[1].strip())
+        if not payload or "sub" not in payload:
+            return JSONResponse(status_code=401, content={"success": False, "message": "Invalid or expired token"})
+        request.state.user_mobile = payload["sub"]
+        return await call_next(request)
+
+
+class LegacyErrorHandlerMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        try:
+            return await call_next(request)
+        except Exception as exc:
+            logging.error(f"Unhandled error: {exc}", exc_info=True)
+            return JSONResponse(status_code=500, content={"success": False, "message": "Internal server error"})
+
+
+async def ok(request):
+    return PlainTextResponse("ok")
+
+
+def build_app(auth_cls, error_cls):
+    routes = [Route("/user/me", ok), Route("/auth/signup", ok, methods=["POST"])]
+    # Same order as app.main: auth outermost
+    return Starlette(routes=routes, middleware=[Middleware(auth_cls), Middleware(error_cls)])
+
+
+async def call(app, method: str, path: str, headers):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "headers": headers,
+        "client": ("127.0.0.1", 1234), "server": ("127.0.0.1", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    status = None
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def measure(app, method, path, headers, requests: int) -> float:
+    assert await call(app, method, path, headers) == 200
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(app, method, path, headers)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = create_access_token({"sub": "15551234567"})
+    auth = [(b"authorization", f"Bearer {token}".encode())]
+    stacks = {
+        "before (BaseHTTPMiddleware)": build_app(LegacyJWTAuthMiddleware, LegacyErrorHandlerMiddleware),
+        "after (pure ASGI + token cache)": build_app(JWTAuthMiddleware, ErrorHandlerMiddleware),
+    }
+    # The legacy middleware prints on every request
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = {
+            name: (
+                await measure(app, "GET", "/user/me", auth, args.requests),
+                await measure(app, "POST", "/auth/signup", [], args.requests),
+            )
+            for name, app in stacks.items()
+        }
+    for name, (authed, public) in results.items():
+        print(f"{name:<34} authenticated {authed:8.1f} us/req   public {public:8.1f} us/req")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Cost of "is this mobile registered?" on a large users table.
+
+    python -m benchmarks.mobile_lookup --rows 2000000 --lookups 2000
+    DATABASE_URL=mysql+aiomysql://... REDIS_URL=redis://... python -m benchmarks.mobile_lookup
+
+Fills `users` with --rows users (skipped if it already holds that many), then
+times lookups of known and unknown numbers three ways:
+- sql_int: WHERE mobile = <integer>, as the auth routes used to query
+- sql_str: WHERE mobile = '<string>', the canonical form
+- redis_set: app.utils.mobile.is_registered against the registered_mobiles set
+SQLite converts the integer before comparing, so the sql_int/sql_str gap only
+shows on MySQL, where the implicit cast defeats the unique index. Without
+DATABASE_URL/REDIS_URL it runs on aiosqlite and fakeredis.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+FIRST_MOBILE = 13000000000
+
+
+async def fill(rows: int):
+    from sqlalchemy import func, insert, select
+    from app.core.database import AsyncSessionLocal
+    from app.models.user import User
+
+    async with AsyncSessionLocal() as db:
+        existing = (await db.execute(select(func.count(User.id)))).scalar()
+    for start in range(existing, rows, 10000):
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(User).values([
+                {"mobile": str(FIRST_MOBILE + n), "name": "bench", "subscription": "Basic"}
+                for n in range(start, min(rows, start + 10000))
+            ]))
+            await db.commit()
+
+
+async def time_lookups(lookup, mobiles: list) -> dict:
+    latencies = []
+    for mobile in mobiles:
+        start = time.perf_counter()
+        await lookup(mobile)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+        "lookups_per_s": round(len(latencies) / (sum(latencies) / 1000), 1),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    if not os.getenv("REDIS_URL"):
+        import fakeredis
+        import app.core.redis_client as redis_module
+        redis_module.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    from sqlalchemy import select, text
+    from app.core.database import AsyncSessionLocal
+    from app.core.schema import create_schema
+    from app.models.user import User
+    from app.utils import mobile as mobile_index
+
+    await create_schema()
+    start = time.perf_counter()
+    await fill(args.rows)
+    filled_s = time.perf_counter() - start
+    start = time.perf_counter()
+    await mobile_index.rebuild_registered_index()
+    indexed_s = time.perf_counter() - start
+
+    rng = random.Random(1)
+    known = [str(FIRST_MOBILE + rng.randrange(args.rows)) for _ in range(args.lookups)]
+    unknown = [str(FIRST_MOBILE + args.rows + rng.randrange(10**6)) for _ in range(args.lookups)]
+
+    async with AsyncSessionLocal() as db:
+        async def sql_int(mobile):
+            # Bound as a literal so the driver can't turn it back into a string
+            return (await db.execute(text(f"SELECT id FROM users WHERE mobile = {int(mobile)}"))).first()
+
+        async def sql_str(mobile):
+            return (await db.execute(select(User.id).where(User.mobile == mobile))).first()
+
+        async def redis_set(mobile):
+            return await mobile_index.is_registered(mobile, db)
+
+        report = {"rows": args.rows, "fill_s": round(filled_s, 1), "index_build_s": round(indexed_s, 1), "lookups": {}}
+        for name, lookup in (("sql_int", sql_int), ("sql_str", sql_str), ("redis_set", redis_set)):
+            report["lookups"][name] = {
+                "known": await time_lookups(lookup, known),
+                "unknown": await time_lookups(lookup, unknown),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""
+Cold-start cost of the API.
+
+    python -m benchmarks.startup --runs 5
+
+Starts fresh interpreters and measures, for each startup mode, the time to
+import app.main and the time from there to the first answered request (startup
+hooks included). "dev" creates the schema on boot; "production" sets
+AUTO_CREATE_SCHEMA=0 as a deploy that runs `python -m app.core.schema` would.
+Also reports whether heavy client libraries were imported.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+async def child():
+    from benchmarks.harness import bootstrap, running_app
+
+    start = time.perf_counter()
+    app = bootstrap()
+    imported = time.perf_counter()
+    from app.utils.jwt import create_access_token
+
+    # Every route but auth and docs needs a token; "/" needs no user row
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': '15550000000'})}"}
+    async with running_app(app) as client:
+        response = await client.get("/", headers=headers)
+        assert response.status_code == 200
+    first_request = time.perf_counter()
+    print(json.dumps({
+        "import_s": imported - start,
+        "first_request_s": first_request - imported,
+        "stripe_imported": "stripe" in sys.modules,
+    }))
+
+
+def run_mode(env_overrides: dict, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        env = {**os.environ, **env_overrides}
+        start = time.perf_counter()
+        out = subprocess.check_output([sys.executable, "-m", "benchmarks.startup", "--child"], env=env, text=True)
+        sample = json.loads(out.strip().splitlines()[-1])
+        sample["process_s"] = time.perf_counter() - start
+        samples.append(sample)
+    return {
+        "import_ms": round(statistics.median(s["import_s"] for s in samples) * 1000, 1),
+        "first_request_ms": round(statistics.median(s["first_request_s"] for s in samples) * 1000, 1),
+        "process_ms": round(statistics.median(s["process_s"] for s in samples) * 1000, 1),
+        "stripe_imported": any(s["stripe_imported"] for s in samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(child())
+        return
+    report = {
+        "dev": run_mode({"AUTO_CREATE_SCHEMA": "1"}, args.runs),
+        "production": run_mode({"AUTO_CREATE_SCHEMA": "0"}, args.runs),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
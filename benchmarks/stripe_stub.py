@@ -0,0 +1,65 @@
+"""
+Local stand-in for the Stripe API, for load tests and manual runs.
+
+    python -m benchmarks.stripe_stub --port 12111 --latency-ms 300
+    STRIPE_API_BASE=http://127.0.0.1:12111 uvicorn app.main:app
+
+Answers POST /v1/checkout/sessions after `--latency-ms`, like a slow Stripe
+round trip, and counts the sessions it created.
+"""
+import argparse
+import asyncio
+import itertools
+import threading
+import time
+from urllib.parse import parse_qs
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def build_app(latency_ms: float = 300) -> FastAPI:
+    app = FastAPI()
+    ids = itertools.count(1)
+    app.state.sessions = 0
+
+    @app.post("/v1/checkout/sessions")
+    async def create_session(request: Request):
+        # Parsed by hand so the stub doesn't need python-multipart
+        form = {k: v[0] for k, v in parse_qs((await request.body()).decode()).items()}
+        if not request.headers.get("authorization"):
+            return JSONResponse(status_code=401, content={"error": {"message": "No API key provided"}})
+        await asyncio.sleep(latency_ms / 1000)
+        app.state.sessions += 1
+        session_id = f"cs_test_{next(ids)}"
+        return {
+            "id": session_id,
+            "object": "checkout.session",
+            "mode": form.get("mode"),
+            "metadata": {"user_mobile": form.get("metadata[user_mobile]")},
+            "url": f"https://checkout.stripe.test/{session_id}",
+        }
+
+    return app
+
+
+def serve_in_thread(port: int, latency_ms: float = 300) -> uvicorn.Server:
+    """Start the stub on 127.0.0.1:`port` in a daemon thread; returns once it listens."""
+    server = uvicorn.Server(uvicorn.Config(build_app(latency_ms), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    args = parser.parse_args()
+    uvicorn.run(build_app(args.latency_ms), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Gemini worker throughput against a stubbed LLM.
+
+    python -m benchmarks.worker_throughput --tasks 400 --latency-ms 20
+
+Runs WorkerEngine with increasing concurrency over the same backlog and prints
+tasks/s for each level, plus the mean queue wait per tier (--pro-share of the
+backlog is Pro, the rest Basic). Uses fakeredis (with Lua support) unless --redis-url is
+given.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+
+from app.utils.queue import QUEUE_PARTITIONS, partition_for, queue_key, ready_key  # noqa: E402
+from app.utils.worker_engine import WorkerEngine  # noqa: E402
+
+
+def make_redis(url):
+    if url:
+        import redis.asyncio as redis
+        return redis.from_url(url, decode_responses=True)
+    import fakeredis
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+async def run_level(redis, concurrency: int, tasks: int, chatrooms: int, latency: float, pro_share: float):
+    await redis.flushdb()
+    async with redis.pipeline(transaction=False) as pipe:
+        for i in range(tasks):
+            chatroom_id = i % chatrooms
+            # Tier by chatroom, so a chatroom's tasks share one queue
+            tier = "pro" if (chatroom_id * 0.618) % 1 < pro_share else "basic"
+            task = {"chatroom_id": chatroom_id, "user_id": 1, "message_id": i, "content": "hi",
+                    "attempts": 0, "tier": tier, "enqueued_at": time.time()}
+            pipe.rpush(queue_key(tier, partition_for(chatroom_id)), json.dumps(task))
+            pipe.rpush(ready_key(tier), partition_for(chatroom_id))
+        await pipe.execute()
+
+    done = asyncio.Event()
+    processed = 0
+    last_seen = {}
+    out_of_order = 0
+    waits = {"pro": [], "basic": []}
+
+    async def handler(task):
+        nonlocal processed, out_of_order
+        waits[task["tier"]].append(time.time() - task["enqueued_at"])
+        await asyncio.sleep(latency)  # stand-in for the LLM call
+        if task["message_id"] < last_seen.get(task["chatroom_id"], -1):
+            out_of_order += 1
+        last_seen[task["chatroom_id"]] = task["message_id"]
+        processed += 1
+        if processed == tasks:
+            done.set()
+
+    engine = WorkerEngine(handler, concurrency=concurrency, redis=redis)
+    start = time.perf_counter()
+    runner = asyncio.create_task(engine.run())
+    await done.wait()
+    elapsed = time.perf_counter() - start
+    engine.stop()
+    await runner
+    mean_wait = {tier: sum(w) / len(w) if w else 0.0 for tier, w in waits.items()}
+    return tasks / elapsed, out_of_order, mean_wait
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=400)
+    parser.add_argument("--chatrooms", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--levels", default="1,2,4,8,16")
+    parser.add_argument("--pro-share", type=float, default=0.25)
+    parser.add_argument("--redis-url", default=None)
+    args = parser.parse_args()
+
+    redis = make_redis(args.redis_url)
+    print(f"partitions={QUEUE_PARTITIONS} tasks={args.tasks} latency={args.latency_ms}ms")
+    baseline = None
+    for level in [int(x) for x in args.levels.split(",")]:
+        rate, out_of_order, wait = await run_level(redis, level, args.tasks, args.chatrooms, args.latency_ms / 1000, args.pro_share)
+        baseline = baseline or rate
+        print(f"concurrency={level:<3} {rate:8.1f} tasks/s  speedup={rate / baseline:5.2f}x  out_of_order={out_of_order}  "
+              f"wait pro={wait['pro']:.2f}s basic={wait['basic']:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+# Local stand-ins for MySQL, Redis and Gemini, set before any app module is imported
+_tmpdir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_tmpdir}/test.db")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+import fakeredis  # noqa: E402
+import app.core.redis_client as redis_module  # noqa: E402
+
+redis_module.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
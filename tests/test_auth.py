@@ -0,0 +1,15 @@
+import pytest
+from app.schemas import OTPRequest
+from app.utils.mobile import canonical_mobile
+
+
+def test_mobiles_are_canonicalized_to_digit_strings():
+    assert canonical_mobile(15550000001) == "15550000001"
+    assert canonical_mobile("+1 (555) 000-0001") == "15550000001"
+    assert OTPRequest(mobile=15550000001).mobile == "15550000001"
+
+
+@pytest.mark.parametrize("value", ["", "12ab567", "+", "1" * 16, True, 1.5])
+def test_invalid_mobiles_are_rejected(value):
+    with pytest.raises(ValueError):
+        canonical_mobile(value)
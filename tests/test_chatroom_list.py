@@ -0,0 +1,76 @@
+import asyncio
+import json
+from sqlalchemy import event
+from app.core.database import engine, AsyncSessionLocal, Base
+from app.core.redis_client import redis_client
+from app.models.user import User
+from app.routes import chatroom as chatroom_routes
+from app.routes.chatroom import create_chatroom, list_chatrooms
+from app.schemas import ChatroomCreate
+
+
+async def _user(mobile: str) -> User:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(mobile=mobile, name="t")
+        db.add(user)
+        await db.commit()
+        return user
+
+
+def _body(response) -> dict:
+    return json.loads(response.body)
+
+
+def test_room_created_after_the_list_was_cached_is_listed():
+    async def scenario():
+        await redis_client.flushall()
+        user = await _user("15550000401")
+        async with AsyncSessionLocal() as db:
+            await create_chatroom(ChatroomCreate(name="first"), current_user=user, db=db)
+        await list_chatrooms(current_user=user)
+        cached = _body(await list_chatrooms(current_user=user))
+        async with AsyncSessionLocal() as db:
+            await create_chatroom(ChatroomCreate(name="second"), current_user=user, db=db)
+        after = _body(await list_chatrooms(current_user=user))
+        await engine.dispose()
+        return cached, after
+
+    cached, after = asyncio.run(scenario())
+    assert cached["cached"] is True
+    assert [room["name"] for room in cached["chatrooms"]] == ["first"]
+    assert [room["name"] for room in after["chatrooms"]] == ["first", "second"]
+
+
+def test_concurrent_misses_run_one_query(monkeypatch):
+    load = chatroom_routes._load_chatrooms
+
+    async def slow_load(user_id, cache_key):
+        # Keeps the first load in flight while the other requests miss
+        await asyncio.sleep(0.05)
+        return await load(user_id, cache_key)
+
+    monkeypatch.setattr(chatroom_routes, "_load_chatrooms", slow_load)
+    queries = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if "FROM chatrooms" in statement:
+            queries.append(statement)
+
+    async def scenario():
+        await redis_client.flushall()
+        user = await _user("15550000402")
+        async with AsyncSessionLocal() as db:
+            await create_chatroom(ChatroomCreate(name="room"), current_user=user, db=db)
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        try:
+            responses = await asyncio.gather(*(list_chatrooms(current_user=user) for _ in range(10)))
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", count)
+        await engine.dispose()
+        return [_body(response)["chatrooms"] for response in responses]
+
+    lists = asyncio.run(scenario())
+    assert len(queries) == 1
+    assert all([room["name"] for room in rooms] == ["room"] for rooms in lists)
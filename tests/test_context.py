@@ -0,0 +1,68 @@
+import asyncio
+from app.core.database import engine, AsyncSessionLocal, Base
+from app.models.user import User
+from app.models.chatroom import Chatroom
+from app.models.message import Message
+from app.utils import context
+from app.utils.history import record_turn
+from app.utils.llm import FakeBackend, compose_prompt, set_backend
+
+
+def test_prompt_size_stays_flat_with_rolling_summary():
+    set_backend(FakeBackend(latency=0))
+
+    async def scenario():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            user = User(mobile="15550000002", name="t")
+            db.add(user)
+            await db.flush()
+            chatroom = Chatroom(name="long", user_id=user.id)
+            db.add(chatroom)
+            await db.commit()
+        sizes = []
+        for turn in range(60):
+            async with AsyncSessionLocal() as db:
+                message = Message(chatroom_id=chatroom.id, sender="user", content=f"question {turn} " * 50)
+                db.add(message)
+                await db.commit()
+            await record_turn(chatroom.id, message.id, "user", message.content)
+            messages = await context.build_context(chatroom.id, message.id)
+            assert messages[-1]["content"] == message.content
+            sizes.append(len(compose_prompt(messages)))
+            await record_turn(chatroom.id, None, "ai", "ok")
+            await context.after_reply(chatroom.id)
+            await asyncio.gather(*context._refreshes)
+        await engine.dispose()
+        return sizes
+
+    sizes = asyncio.run(scenario())
+    # Window budget, the capped summary and some room for role labels; the full
+    # history would be about 60 * 600 characters by the end
+    assert max(sizes) <= context.CONTEXT_MAX_TOKENS * 4 + context.SUMMARY_MAX_CHARS + 500
+
+
+def test_newer_messages_do_not_crowd_out_the_one_answered():
+    async def scenario():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            user = User(mobile="15550000003", name="t")
+            db.add(user)
+            await db.flush()
+            chatroom = Chatroom(name="burst", user_id=user.id)
+            db.add(chatroom)
+            await db.flush()
+            question = Message(chatroom_id=chatroom.id, sender="user", content="What is 2+2?")
+            db.add(question)
+            await db.flush()
+            # Posted before the worker gets to the question, and over the budget on its own
+            db.add(Message(chatroom_id=chatroom.id, sender="user", content="x" * (context.CONTEXT_MAX_TOKENS * 4 + 1000)))
+            await db.commit()
+        messages = await context.build_context(chatroom.id, question.id)
+        await engine.dispose()
+        return messages
+
+    messages = asyncio.run(scenario())
+    assert messages[-1] == {"role": "user", "content": "What is 2+2?"}
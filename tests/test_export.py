@@ -0,0 +1,40 @@
+import asyncio
+import json
+from datetime import datetime
+from app.core.database import engine, AsyncSessionLocal, Base
+from app.models.user import User
+from app.models.chatroom import Chatroom
+from app.models.message import Message
+from app.routes import user as user_routes
+
+
+def test_export_in_small_chunks_is_complete(monkeypatch):
+    monkeypatch.setattr(user_routes, "EXPORT_CHUNK_SIZE", 2)
+
+    async def scenario():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            user = User(mobile="15550000202", name="t")
+            db.add(user)
+            await db.flush()
+            rooms = [Chatroom(name=f"room {i}", user_id=user.id) for i in range(3)]
+            db.add_all(rooms)
+            await db.flush()
+            for i in range(10):
+                db.add(Message(chatroom_id=rooms[0].id, sender="user", content=f"m{i}"))
+            # Chunk boundaries inside a run of equal timestamps
+            same_second = datetime(2030, 1, 1, 12, 0, 0)
+            for i in range(5):
+                db.add(Message(chatroom_id=rooms[1].id, sender="user", content=f"r{i}", created_at=same_second))
+            await db.commit()
+            user_id = user.id
+        lines = [json.loads(line) async for chunk in user_routes._export_lines(user_id) for line in chunk.splitlines()]
+        await engine.dispose()
+        return lines
+
+    lines = asyncio.run(scenario())
+    messages = [line for line in lines if line["type"] == "message"]
+    assert [line["content"] for line in messages] == [f"m{i}" for i in range(10)] + [f"r{i}" for i in range(5)]
+    assert sum(line["type"] == "chatroom" for line in lines) == 3
+    assert lines[-1] == {"type": "end", "chatrooms": 3, "messages": 15}
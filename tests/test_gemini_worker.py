@@ -0,0 +1,50 @@
+import asyncio
+from sqlalchemy import delete, select
+from app.core.database import engine, AsyncSessionLocal, Base
+from app.core.redis_client import redis_client
+from app.models.user import User
+from app.models.chatroom import Chatroom
+from app.models.message import Message
+from app.utils import context, gemini_worker
+from app.utils.llm import FakeBackend, set_backend
+from app.utils.queue import enqueue_gemini_task, partition_for
+from app.utils.worker_engine import WorkerEngine
+
+
+def test_failure_after_the_reply_is_saved_does_not_run_the_task_again(monkeypatch):
+    backend = FakeBackend(latency=0)
+    set_backend(backend)
+
+    async def broken_after_reply(chatroom_id):
+        raise ConnectionError("Connection refused")
+
+    monkeypatch.setattr(context, "after_reply", broken_after_reply)
+
+    async def scenario():
+        await redis_client.flushall()
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            user = User(mobile="15550000301", name="t")
+            db.add(user)
+            await db.flush()
+            chatroom = Chatroom(name="room", user_id=user.id)
+            db.add(chatroom)
+            await db.flush()
+            message = Message(chatroom_id=chatroom.id, sender="user", content="hi")
+            db.add(message)
+            await db.commit()
+        await enqueue_gemini_task(chatroom.id, user.id, message.id, "hi", tier="basic")
+        workers = WorkerEngine(gemini_worker.process_task, concurrency=1, partitions=4)
+        await workers._drain("basic", partition_for(chatroom.id), "test-token")
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Message.content).where(Message.chatroom_id == chatroom.id, Message.sender == "ai"))
+            replies = result.scalars().all()
+            # Other tests count AI messages
+            await db.execute(delete(Message).where(Message.chatroom_id == chatroom.id))
+            await db.commit()
+        await engine.dispose()
+        return replies
+
+    assert asyncio.run(scenario()) == ["Echo: hi"]
+    assert backend.calls == 1
@@ -0,0 +1,34 @@
+import asyncio
+from app.utils import idempotency
+
+
+def test_record_survives_attach_after_the_worker_completed_it():
+    async def scenario():
+        fingerprint = idempotency.fingerprint(7, "hello")
+        assert await idempotency.begin(1, "k1", fingerprint) is None
+        # A cached reply can be published before the request attaches its message id
+        await idempotency.complete(1, "k1", 200, idempotency.reply_body(42, "hi"))
+        await idempotency.attach(1, "k1", 42)
+        return await idempotency.begin(1, "k1", fingerprint)
+
+    record = asyncio.run(scenario())
+    assert record["state"] == "done"
+    assert record["status"] == 200
+    assert record["body"] == {"success": True, "message_id": 42, "ai_message": "hi"}
+    assert record["fingerprint"] == idempotency.fingerprint(7, "hello")
+
+
+def test_fingerprint_tells_requests_apart():
+    assert idempotency.fingerprint(7, "hello") == idempotency.fingerprint(7, "hello")
+    assert idempotency.fingerprint(7, "hello") != idempotency.fingerprint(8, "hello")
+    assert idempotency.fingerprint(7, "hello") != idempotency.fingerprint(7, "hello!")
+
+
+def test_released_key_is_not_recreated():
+    async def scenario():
+        await idempotency.begin(1, "k2", idempotency.fingerprint(7, "x"))
+        await idempotency.release(1, "k2")
+        await idempotency.complete(1, "k2", 200, {})
+        return await idempotency.begin(1, "k2", idempotency.fingerprint(7, "y"))
+
+    assert asyncio.run(scenario()) is None
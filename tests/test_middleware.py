@@ -0,0 +1,6 @@
+from app.middleware import is_public_path
+
+
+def test_metrics_are_not_public_by_default():
+    assert not is_public_path("/metrics", "GET")
+    assert is_public_path("/auth/send-otp", "POST")
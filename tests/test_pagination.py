@@ -0,0 +1,50 @@
+import asyncio
+import json
+from datetime import datetime
+from sqlalchemy import select
+from app.core.database import engine, AsyncSessionLocal, Base
+from app.models.user import User
+from app.models.chatroom import Chatroom
+from app.models.message import Message
+from app.routes.chatroom import list_messages
+
+
+def test_following_next_cursor_visits_every_message_once():
+    async def scenario():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            user = User(mobile="15550000201", name="t")
+            db.add(user)
+            await db.flush()
+            chatroom = Chatroom(name="pages", user_id=user.id)
+            db.add(chatroom)
+            await db.flush()
+            # Timestamped on insert, as the routes and the reply writer do
+            for i in range(5):
+                db.add(Message(chatroom_id=chatroom.id, sender="user", content=f"m{i}"))
+            await db.flush()
+            # Rows sharing a timestamp are told apart by id
+            same_second = datetime(2030, 1, 1, 12, 0, 0)
+            for i in range(5, 12):
+                db.add(Message(chatroom_id=chatroom.id, sender="user", content=f"m{i}", created_at=same_second))
+            await db.commit()
+            result = await db.execute(select(Message.id).where(Message.chatroom_id == chatroom.id))
+            expected = [row.id for row in result]
+
+            pages, cursor = [], None
+            while len(pages) < 20:
+                response = await list_messages(chatroom.id, before=cursor, limit=3, current_user=user, db=db)
+                body = json.loads(response.body)
+                pages.append([m["id"] for m in body["messages"]])
+                cursor = body["next_cursor"]
+                if cursor is None:
+                    break
+        await engine.dispose()
+        return pages, expected
+
+    pages, expected = asyncio.run(scenario())
+    seen = [message_id for page in pages for message_id in page]
+    assert all(len(page) <= 3 for page in pages)
+    assert sorted(seen) == sorted(expected)
+    assert len(seen) == len(set(seen)) == 12
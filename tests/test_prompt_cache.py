@@ -0,0 +1,87 @@
+import asyncio
+from sqlalchemy import delete, select
+from app.core.database import engine, AsyncSessionLocal, Base
+from app.core.redis_client import redis_client
+from app.models.user import User
+from app.models.chatroom import Chatroom
+from app.models.message import Message
+from app.utils import gemini_worker, prompt_cache
+from app.utils.llm import FakeBackend, set_backend
+from app.utils.prompt_cache import PROMPT_INDEX_KEY, get_cached_reply, store_reply
+
+
+async def _answer_in_new_rooms(mobile: str, tier: str, rooms: int = 2) -> list:
+    """Ask "hi" in `rooms` fresh chatrooms; returns each room's AI messages."""
+    await redis_client.flushall()
+    prompt_cache._near_cache.clear()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(mobile=mobile, name="t")
+        db.add(user)
+        await db.flush()
+        messages = []
+        for i in range(rooms):
+            chatroom = Chatroom(name=f"room{i}", user_id=user.id)
+            db.add(chatroom)
+            await db.flush()
+            message = Message(chatroom_id=chatroom.id, sender="user", content="hi")
+            db.add(message)
+            messages.append(message)
+        await db.commit()
+    for message in messages:
+        await gemini_worker.process_task({
+            "chatroom_id": message.chatroom_id, "user_id": user.id, "message_id": message.id,
+            "content": "hi", "attempts": 0, "tier": tier,
+        })
+    chatroom_ids = [message.chatroom_id for message in messages]
+    async with AsyncSessionLocal() as db:
+        replies = []
+        for chatroom_id in chatroom_ids:
+            result = await db.execute(select(Message.content).where(Message.chatroom_id == chatroom_id, Message.sender == "ai"))
+            replies.append(result.scalars().all())
+        # Other tests count AI messages
+        await db.execute(delete(Message).where(Message.chatroom_id.in_(chatroom_ids)))
+        await db.commit()
+    await engine.dispose()
+    return replies
+
+
+def test_cache_hit_skips_the_llm_but_stores_the_reply():
+    backend = FakeBackend(latency=0)
+    set_backend(backend)
+
+    replies = asyncio.run(_answer_in_new_rooms("15550000501", "basic"))
+    assert backend.calls == 1
+    assert replies == [["Echo: hi"], ["Echo: hi"]]
+
+
+def test_tiers_left_out_of_prompt_cache_tiers_always_call_the_llm(monkeypatch):
+    monkeypatch.setattr(prompt_cache, "PROMPT_CACHE_TIERS", {"basic"})
+    backend = FakeBackend(latency=0)
+    set_backend(backend)
+
+    replies = asyncio.run(_answer_in_new_rooms("15550000502", "pro"))
+    assert backend.calls == 2
+    assert replies == [["Echo: hi"], ["Echo: hi"]]
+
+
+def test_redis_tier_drops_the_oldest_entries_beyond_its_size(monkeypatch):
+    monkeypatch.setattr(prompt_cache, "PROMPT_CACHE_REDIS_SIZE", 2)
+    clock = [1000.0]
+    monkeypatch.setattr(prompt_cache.time, "time", lambda: clock[0])
+    prompts = [[{"role": "user", "content": f"q{i}"}] for i in range(3)]
+
+    async def scenario():
+        await redis_client.flushall()
+        for i, prompt in enumerate(prompts):
+            clock[0] += 1
+            await store_reply(prompt, "fake", f"a{i}")
+        # Only the Redis tier is under test
+        prompt_cache._near_cache.clear()
+        found = [await get_cached_reply(prompt, "fake") for prompt in prompts]
+        return found, await redis_client.zcard(PROMPT_INDEX_KEY)
+
+    found, indexed = asyncio.run(scenario())
+    assert found == [None, "a1", "a2"]
+    assert indexed == 2
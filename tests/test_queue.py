@@ -0,0 +1,152 @@
+import asyncio
+import json
+import time
+from collections import Counter
+import pytest
+from app.core.redis_client import redis_client
+from app.routes.chatroom import _overloaded_response
+from app.utils import queue
+from app.utils.queue import (
+    QUEUE_NAME, QUEUE_WAIT_SLO, SHED_FACTOR, USER_PENDING_LIMIT, Overloaded,
+    admit_task, enqueue_gemini_task, migrate_legacy_queue, over_slo, partition_for, queue_key, ready_key, route_key,
+)
+from app.utils.worker_engine import WorkerEngine
+
+
+def test_busy_tiers_are_dequeued_by_weight():
+    engine = WorkerEngine(None, concurrency=1, partitions=4, tiers={"pro": 3, "basic": 1})
+
+    async def scenario():
+        await redis_client.flushall()
+        # Both tiers have more announced work than we take
+        await redis_client.rpush(ready_key("pro"), *range(200))
+        await redis_client.rpush(ready_key("basic"), *range(200))
+        taken = Counter()
+        for _ in range(200):
+            key, _ = await redis_client.blpop(engine._ready_keys(), timeout=1)
+            taken[key] += 1
+        return taken
+
+    taken = asyncio.run(scenario())
+    assert taken == {ready_key("pro"): 150, ready_key("basic"): 50}
+
+
+def test_idle_tier_does_not_hold_back_the_busy_one():
+    engine = WorkerEngine(None, concurrency=1, partitions=4, tiers={"pro": 3, "basic": 1})
+
+    async def scenario():
+        await redis_client.flushall()
+        await redis_client.rpush(ready_key("basic"), *range(8))
+        return [(await redis_client.blpop(engine._ready_keys(), timeout=1))[0] for _ in range(8)]
+
+    assert set(asyncio.run(scenario())) == {ready_key("basic")}
+
+
+def test_pending_cap_refuses_with_429_until_a_task_is_acked():
+    handled = []
+
+    async def handler(task):
+        handled.append(task["message_id"])
+
+    async def scenario():
+        await redis_client.flushall()
+        for message_id in range(USER_PENDING_LIMIT):
+            await admit_task(7, "basic")
+            await enqueue_gemini_task(11, 7, message_id, "hi", tier="basic")
+        with pytest.raises(Overloaded) as refused:
+            await admit_task(7, "basic")
+        # Another user is not affected
+        await admit_task(8, "basic")
+        engine = WorkerEngine(handler, concurrency=1, partitions=4)
+        await engine._drain("basic", partition_for(11), "test-token")
+        await admit_task(7, "basic")
+        return refused.value
+
+    refused = asyncio.run(scenario())
+    assert refused.status_code == 429
+    assert refused.retry_after
+    assert len(handled) == USER_PENDING_LIMIT
+
+
+def test_tier_over_slo_answers_early_and_sheds_above_the_factor(monkeypatch):
+    slo = QUEUE_WAIT_SLO["basic"]
+    clock = [time.time()]
+    monkeypatch.setattr(queue.time, "time", lambda: clock[0])
+
+    async def scenario():
+        await redis_client.flushall()
+        # The oldest queued task decides, whichever partition it is in
+        await enqueue_gemini_task(21, 9, 1, "m1", tier="basic")
+        clock[0] += 1
+        await enqueue_gemini_task(22, 9, 2, "m2", tier="basic")
+        fresh = await admit_task(9, "basic")
+        clock[0] += slo * 2
+        behind = await admit_task(9, "basic")
+        # Nobody is taking tasks: the wait keeps growing until Basic is shed
+        clock[0] += slo * SHED_FACTOR
+        with pytest.raises(Overloaded) as shed:
+            await admit_task(9, "basic")
+        # Pro has its own queue and is not shed with Basic
+        pro_wait = await admit_task(9, "pro")
+        await redis_client.delete(queue_key("basic", partition_for(21)), queue_key("basic", partition_for(22)))
+        drained = await admit_task(9, "basic")
+        return fresh, behind, shed.value, pro_wait, drained
+
+    fresh, behind, shed, pro_wait, drained = asyncio.run(scenario())
+    assert fresh == 1
+    assert over_slo("basic", behind)
+    assert shed.status_code == 503
+    assert shed.retry_after >= slo * SHED_FACTOR
+    response = _overloaded_response(shed)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(shed.retry_after)
+    assert pro_wait == 0
+    assert drained == 0
+
+
+def test_chatroom_stays_in_its_tier_until_its_tasks_drain():
+    handled = []
+
+    async def handler(task):
+        handled.append(task["message_id"])
+
+    async def scenario():
+        await redis_client.flushall()
+        partition = partition_for(12)
+        await enqueue_gemini_task(12, 7, 1, "m1", tier="basic")
+        await enqueue_gemini_task(12, 7, 2, "m2", tier="basic")
+        # Upgraded while Basic tasks are still queued: stays behind them
+        upgraded = await enqueue_gemini_task(12, 7, 3, "m3", tier="pro")
+        queued = await redis_client.llen(queue_key("basic", partition)), await redis_client.llen(queue_key("pro", partition))
+        engine = WorkerEngine(handler, concurrency=1, partitions=4)
+        await engine._drain("basic", partition_for(12), "test-token")
+        drained = await redis_client.exists(route_key(12))
+        after = await enqueue_gemini_task(12, 7, 4, "m4", tier="pro")
+        return upgraded, queued, drained, after
+
+    upgraded, queued, drained, after = asyncio.run(scenario())
+    assert upgraded == "basic"
+    assert queued == (3, 0)
+    assert handled == [1, 2, 3]
+    assert drained == 0
+    assert after == "pro"
+
+
+def test_tasks_left_in_the_single_list_are_moved_to_the_partitions():
+    handled = []
+
+    async def handler(task):
+        handled.append(task["message_id"])
+
+    async def scenario():
+        await redis_client.flushall()
+        # As queued before tiers and partitions existed
+        for message_id in (1, 2):
+            await redis_client.rpush(QUEUE_NAME, json.dumps({"chatroom_id": 13, "user_id": 7, "message_id": message_id, "content": "hi"}))
+        moved = await migrate_legacy_queue()
+        left = await redis_client.llen(QUEUE_NAME)
+        await WorkerEngine(handler, concurrency=1, partitions=4)._drain("basic", partition_for(13), "test-token")
+        return moved, left
+
+    assert asyncio.run(scenario()) == (2, 0)
+    assert handled == [1, 2]
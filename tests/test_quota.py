@@ -0,0 +1,90 @@
+import asyncio
+import time
+from sqlalchemy import delete
+from app.core.database import engine, AsyncSessionLocal, Base
+from app.core.redis_client import redis_client
+from app.models.user import User
+from app.models.chatroom import Chatroom
+from app.models.message import Message
+from app.utils import gemini_worker, quota, worker_engine
+from app.utils.quota import TIER_LIMITS, reserve_message
+from app.utils.queue import enqueue_gemini_task, partition_for
+from app.utils.worker_engine import WorkerEngine
+
+
+def test_concurrent_reservations_never_exceed_the_daily_limit():
+    user = User(id=101, mobile="15550000101", subscription="Basic")
+    limit = TIER_LIMITS["basic"]["daily"]
+
+    async def scenario():
+        await redis_client.flushall()
+        return await asyncio.gather(*(reserve_message(user) for _ in range(limit * 4)))
+
+    reservations = asyncio.run(scenario())
+    assert sum(r is not None for r in reservations) == limit
+
+
+def test_dead_lettered_task_gives_the_message_back(monkeypatch):
+    monkeypatch.setattr(worker_engine, "RETRY_BACKOFF", 0)
+    limit = TIER_LIMITS["basic"]["daily"]
+
+    async def failing(task):
+        raise RuntimeError("LLM down")
+
+    async def scenario():
+        await redis_client.flushall()
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            user = User(mobile="15550000102", name="t", subscription="Basic")
+            db.add(user)
+            await db.flush()
+            chatroom = Chatroom(name="room", user_id=user.id)
+            db.add(chatroom)
+            await db.commit()
+        reservations = [await reserve_message(user) for _ in range(limit)]
+        over_limit = await reserve_message(user)
+        await enqueue_gemini_task(chatroom.id, user.id, 1, "hi", quota=reservations[0], tier="basic")
+        workers = WorkerEngine(failing, concurrency=1, partitions=4, on_dead=gemini_worker.on_dead_task)
+        await workers._drain("basic", partition_for(chatroom.id), "test-token")
+        refunded = await reserve_message(user)
+        # on_dead_task stored an error reply; other tests count AI messages
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Message).where(Message.chatroom_id == chatroom.id))
+            await db.commit()
+        await engine.dispose()
+        return over_limit, refunded
+
+    over_limit, refunded = asyncio.run(scenario())
+    assert over_limit is None
+    assert refunded is not None
+
+
+def test_token_bucket_refills_over_time_and_refunds_are_capped(monkeypatch):
+    user = User(id=103, mobile="15550000103", subscription="Pro")
+    limits = TIER_LIMITS["pro"]
+    # Whole seconds: refill amounts below are exact
+    clock = [float(int(time.time()))]
+    monkeypatch.setattr(quota.time, "time", lambda: clock[0])
+
+    async def take(n: int) -> int:
+        return sum([await reserve_message(user) is not None for _ in range(n)])
+
+    async def scenario():
+        await redis_client.flushall()
+        burst = await take(limits["burst"] + 1)
+        # Three tokens' worth of time later
+        clock[0] += 3 * 60 / limits["per_minute"]
+        refilled = await take(4)
+        # A long pause fills the bucket; refunds can't push it past the burst
+        clock[0] += 3600
+        first = await reserve_message(user)
+        for _ in range(5):
+            await quota.refund(first)
+        capped = await take(limits["burst"] + 1)
+        return burst, refilled, capped
+
+    burst, refilled, capped = asyncio.run(scenario())
+    assert burst == limits["burst"]
+    assert refilled == 3
+    assert capped == limits["burst"]
@@ -0,0 +1,33 @@
+import asyncio
+from app.utils.replies import ReplyListener
+
+
+def test_room_subscribers_get_replies_of_their_chatroom_only():
+    listener = ReplyListener()
+    first, second = asyncio.Queue(), asyncio.Queue()
+    listener._rooms = {1: {first}, 2: {second}}
+
+    listener._dispatch({"message_id": 10, "chatroom_id": 1, "content": "Echo: hi"})
+    listener.unsubscribe_room(2, second)
+    listener._dispatch({"message_id": 11, "chatroom_id": 2, "content": "Echo: yo"})
+
+    assert first.get_nowait()["message_id"] == 10
+    assert first.empty() and second.empty()
+    assert listener._rooms == {1: {first}}
+
+
+def test_wait_gives_up_when_the_subscription_never_comes_up():
+    listener = ReplyListener()
+
+    async def unreachable():
+        # Stands in for a listener stuck reconnecting to Redis
+        await asyncio.sleep(3600)
+
+    listener._run = unreachable
+
+    async def scenario():
+        reply = await listener.wait(10, timeout=0.1)
+        await listener.stop()
+        return reply, listener._waiters
+
+    assert asyncio.run(scenario()) == (None, {})
@@ -0,0 +1,105 @@
+import asyncio
+from sqlalchemy import delete, event, select
+from app.core.database import engine, AsyncSessionLocal, Base
+from app.models.user import User
+from app.models.chatroom import Chatroom
+from app.models.message import Message
+from app.utils import reply_writer as reply_writer_module
+from app.utils.reply_writer import ReplyWriter
+
+
+async def _chatroom(mobile: str) -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(mobile=mobile, name="t")
+        db.add(user)
+        await db.flush()
+        chatroom = Chatroom(name="room", user_id=user.id)
+        db.add(chatroom)
+        await db.commit()
+        return chatroom.id
+
+
+async def _take_replies(chatroom_id: int) -> list:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Message.content).where(Message.chatroom_id == chatroom_id).order_by(Message.id))
+        replies = result.scalars().all()
+        # Other tests count AI messages
+        await db.execute(delete(Message).where(Message.chatroom_id == chatroom_id))
+        await db.commit()
+    await engine.dispose()
+    return replies
+
+
+class _Statements:
+    """Counts INSERTs into messages and COMMITs while listening."""
+
+    def __init__(self):
+        self.inserts = 0
+        self.commits = 0
+
+    def _execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO messages"):
+            self.inserts += 1
+
+    def _commit(self, conn):
+        self.commits += 1
+
+    def __enter__(self):
+        event.listen(engine.sync_engine, "before_cursor_execute", self._execute)
+        event.listen(engine.sync_engine, "commit", self._commit)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine.sync_engine, "before_cursor_execute", self._execute)
+        event.remove(engine.sync_engine, "commit", self._commit)
+
+
+def test_writes_within_the_delay_share_one_insert_and_commit():
+    async def scenario():
+        chatroom_id = await _chatroom("15550000601")
+        writer = ReplyWriter(batch_size=50, delay=0.05)
+        with _Statements() as statements:
+            await asyncio.gather(*(writer.write(chatroom_id, f"r{i}") for i in range(5)))
+        return statements, await _take_replies(chatroom_id)
+
+    statements, replies = asyncio.run(scenario())
+    assert (statements.inserts, statements.commits) == (1, 1)
+    assert replies == ["r0", "r1", "r2", "r3", "r4"]
+
+
+def test_a_full_batch_is_written_without_waiting_for_the_delay():
+    async def scenario():
+        chatroom_id = await _chatroom("15550000602")
+        writer = ReplyWriter(batch_size=3, delay=3600)
+        with _Statements() as statements:
+            await asyncio.wait_for(asyncio.gather(*(writer.write(chatroom_id, f"r{i}") for i in range(3))), timeout=5)
+        return statements, await _take_replies(chatroom_id)
+
+    statements, replies = asyncio.run(scenario())
+    assert (statements.inserts, statements.commits) == (1, 1)
+    assert replies == ["r0", "r1", "r2"]
+
+
+def test_failed_commit_fails_every_writer_in_the_batch(monkeypatch):
+    def failing_session():
+        session = AsyncSessionLocal()
+
+        async def commit():
+            raise ConnectionError("Lost connection to MySQL server")
+
+        session.commit = commit
+        return session
+
+    monkeypatch.setattr(reply_writer_module, "AsyncSessionLocal", failing_session)
+
+    async def scenario():
+        chatroom_id = await _chatroom("15550000603")
+        writer = ReplyWriter(batch_size=50, delay=0.01)
+        results = await asyncio.gather(*(writer.write(chatroom_id, f"r{i}") for i in range(3)), return_exceptions=True)
+        return results, await _take_replies(chatroom_id)
+
+    results, replies = asyncio.run(scenario())
+    assert [type(result) for result in results] == [ConnectionError] * 3
+    assert replies == []
@@ -0,0 +1,20 @@
+from app.utils.sql_profile import SQL_REPEAT_THRESHOLD, RequestProfile
+
+SELECT_USER = "SELECT users.id FROM users WHERE users.id = ?"
+
+
+def test_same_statement_with_different_parameters_is_flagged():
+    profile = RequestProfile("GET /chatroom/")
+    for user_id in range(SQL_REPEAT_THRESHOLD):
+        profile.record(SELECT_USER, (user_id,), 0.001)
+    profile.record("SELECT 1", (), 0.001)
+    assert profile.repeated() == [(SELECT_USER, SQL_REPEAT_THRESHOLD)]
+    assert profile.duplicated() == []
+
+
+def test_identical_repeats_are_reported_separately():
+    profile = RequestProfile("GET /chatroom/")
+    for _ in range(SQL_REPEAT_THRESHOLD):
+        profile.record(SELECT_USER, (1,), 0.001)
+    assert profile.repeated() == [(SELECT_USER, SQL_REPEAT_THRESHOLD)]
+    assert profile.duplicated() == [(SELECT_USER, SQL_REPEAT_THRESHOLD)]
@@ -0,0 +1,45 @@
+import asyncio
+from sqlalchemy import select
+from app.core.database import engine, AsyncSessionLocal, Base
+from app.models.user import User
+from app.models.chatroom import Chatroom
+from app.models.message import Message
+from app.utils import gemini_worker
+from app.utils.llm import FakeBackend, set_backend
+from app.utils.streams import relay_events
+
+
+def test_stream_task_relays_chunks_and_persists_reply():
+    # Replies "Echo: <last message>", one word per chunk
+    set_backend(FakeBackend(latency=0))
+
+    async def scenario():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            user = User(mobile="15550000001", name="t")
+            db.add(user)
+            await db.flush()
+            chatroom = Chatroom(name="room", user_id=user.id)
+            db.add(chatroom)
+            await db.flush()
+            message = Message(chatroom_id=chatroom.id, sender="user", content="hi there")
+            db.add(message)
+            await db.commit()
+        task = {"chatroom_id": chatroom.id, "user_id": user.id, "message_id": message.id,
+                "content": "hi there", "attempts": 0, "stream": True}
+        await gemini_worker.process_task(task)
+
+        events = [e async for e in relay_events(message.id, timeout=1)]
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Message).where(Message.sender == "ai"))
+            ai_messages = result.scalars().all()
+        await engine.dispose()
+        return events, ai_messages
+
+    events, ai_messages = asyncio.run(scenario())
+    assert [e for e, _ in events] == ["token", "token", "token", "done"]
+    assert "".join(d["text"] for e, d in events if e == "token") == "Echo: hi there"
+    assert events[-1][1]["content"] == "Echo: hi there"
+    # Streamed or not, the reply is stored as a single row
+    assert [m.content for m in ai_messages] == ["Echo: hi there"]
@@ -0,0 +1,38 @@
+import asyncio
+from app.core.redis_client import redis_client
+from app.utils.stripe_events import APPLIED_KEY, drop_stale, plan_changes
+
+
+def _event(event_id, event_type, created, obj):
+    return {"id": event_id, "type": event_type, "created": created, "data": {"object": obj}}
+
+
+def test_latest_event_per_user_wins_within_a_batch():
+    events = [
+        _event("evt_3", "customer.subscription.deleted", 30, {"metadata": {"user_mobile": "15550000001"}}),
+        _event("evt_1", "checkout.session.completed", 10, {"metadata": {"user_mobile": "15550000001"}}),
+        _event("evt_2", "invoice.paid", 20, {"subscription_details": {"metadata": {"user_mobile": "15550000002"}}}),
+        _event("evt_4", "checkout.session.completed", 40, {"metadata": {}}),
+        _event("evt_5", "invoice.paid", 50, None),
+    ]
+    assert plan_changes(events) == {"15550000001": ("Basic", 30), "15550000002": ("Pro", 20)}
+
+
+def test_older_event_in_a_later_batch_is_skipped():
+    deleted = _event("evt_2", "customer.subscription.deleted", 20, {"metadata": {"user_mobile": "15550000003"}})
+    renewed = _event("evt_1", "invoice.paid", 10, {"subscription_details": {"metadata": {"user_mobile": "15550000003"}}})
+    other = _event("evt_3", "invoice.paid", 5, {"subscription_details": {"metadata": {"user_mobile": "15550000004"}}})
+
+    async def scenario():
+        await redis_client.delete(APPLIED_KEY)
+        first = await drop_stale(plan_changes([deleted]))
+        # Delivered late, after the cancellation was applied
+        second = await drop_stale(plan_changes([renewed, other]))
+        # Redelivery of an applied batch (e.g. after a failed commit) goes through
+        again = await drop_stale(plan_changes([deleted]))
+        return first, second, again
+
+    first, second, again = asyncio.run(scenario())
+    assert first == {"15550000003": "Basic"}
+    assert second == {"15550000004": "Pro"}
+    assert again == {"15550000003": "Basic"}
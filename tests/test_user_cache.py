@@ -0,0 +1,41 @@
+import asyncio
+from app.core.database import engine, AsyncSessionLocal, Base
+from app.core.redis_client import redis_client
+from app.models.user import User
+from app.utils.user import USER_KEY, _load_user_fields, invalidate_user
+
+
+class _InvalidatedMidRead:
+    """A session whose row changes (and is invalidated) right after it is read."""
+
+    def __init__(self, db, mobile):
+        self.db = db
+        self.mobile = mobile
+
+    async def execute(self, query):
+        result = await self.db.execute(query)
+        await invalidate_user(self.mobile)
+        return result
+
+
+def test_row_read_before_an_invalidation_is_not_cached():
+    mobile = "15550000009"
+
+    async def scenario():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            db.add(User(mobile=mobile, name="t", subscription="Basic"))
+            await db.commit()
+            fields = await _load_user_fields(mobile, _InvalidatedMidRead(db, mobile))
+            stale_cached = await redis_client.exists(USER_KEY.format(mobile=mobile))
+            # Without a concurrent change the next read fills the cache as usual
+            await _load_user_fields(mobile, db)
+            cached = await redis_client.hgetall(USER_KEY.format(mobile=mobile))
+        await engine.dispose()
+        return fields, stale_cached, cached
+
+    fields, stale_cached, cached = asyncio.run(scenario())
+    assert fields["subscription"] == "Basic"
+    assert stale_cached == 0
+    assert cached["subscription"] == "Basic"
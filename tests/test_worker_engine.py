@@ -0,0 +1,100 @@
+import asyncio
+import json
+from app.core.redis_client import redis_client
+from app.utils import worker_engine
+from app.utils.queue import DEAD_LETTER_KEY, enqueue_gemini_task, partition_for, processing_key, queue_key
+from app.utils.worker_engine import WorkerEngine
+
+PARTITIONS = 4
+
+
+def _engine(handler, **kwargs) -> WorkerEngine:
+    return WorkerEngine(handler, concurrency=1, partitions=PARTITIONS, tiers={"pro": 3, "basic": 1}, **kwargs)
+
+
+async def _drain(engine: WorkerEngine, chatroom_id: int, tier: str = "basic"):
+    await engine._drain(tier, partition_for(chatroom_id), "test-token")
+
+
+def test_tasks_of_a_chatroom_run_in_order_and_are_acked():
+    handled = []
+
+    async def handler(task):
+        handled.append(task["message_id"])
+
+    async def scenario():
+        await redis_client.flushall()
+        for message_id in range(1, 6):
+            await enqueue_gemini_task(3, 1, message_id, f"m{message_id}", tier="basic")
+        engine = _engine(handler)
+        await _drain(engine, 3)
+        partition = partition_for(3)
+        return await redis_client.llen(queue_key("basic", partition)), await redis_client.llen(processing_key("basic", partition))
+
+    assert asyncio.run(scenario()) == (0, 0)
+    assert handled == [1, 2, 3, 4, 5]
+
+
+def test_leftovers_in_the_processing_list_run_first():
+    handled = []
+
+    async def handler(task):
+        handled.append(task["message_id"])
+
+    async def scenario():
+        await redis_client.flushall()
+        partition = partition_for(5)
+        # Left behind by an owner that died mid-task
+        leftover = {"chatroom_id": 5, "user_id": 1, "message_id": 1, "content": "m1", "attempts": 0, "tier": "basic"}
+        await redis_client.rpush(processing_key("basic", partition), json.dumps(leftover))
+        await enqueue_gemini_task(5, 1, 2, "m2", tier="basic")
+        await _drain(_engine(handler), 5)
+        return await redis_client.llen(processing_key("basic", partition))
+
+    assert asyncio.run(scenario()) == 0
+    assert handled == [1, 2]
+
+
+def test_failing_task_is_retried_then_dead_lettered(monkeypatch):
+    monkeypatch.setattr(worker_engine, "RETRY_BACKOFF", 0)
+    calls, dead = [], []
+
+    async def handler(task):
+        calls.append(task["attempts"])
+        raise RuntimeError("LLM down")
+
+    async def on_dead(task, exc):
+        dead.append((task["message_id"], str(exc)))
+
+    async def scenario():
+        await redis_client.flushall()
+        await enqueue_gemini_task(6, 1, 9, "m9", tier="basic")
+        await _drain(_engine(handler, on_dead=on_dead, max_attempts=3), 6)
+        letters = await redis_client.lrange(DEAD_LETTER_KEY, 0, -1)
+        return [json.loads(letter) for letter in letters], await redis_client.llen(processing_key("basic", partition_for(6)))
+
+    letters, in_flight = asyncio.run(scenario())
+    assert calls == [0, 1, 2]
+    assert dead == [(9, "LLM down")]
+    assert [(letter["message_id"], letter["attempts"], letter["error"]) for letter in letters] == [(9, 3, "LLM down")]
+    assert in_flight == 0
+
+
+def test_slot_survives_redis_errors(monkeypatch):
+    monkeypatch.setattr(worker_engine, "RETRY_BACKOFF", 0)
+    polls = []
+
+    async def scenario():
+        engine = _engine(None)
+
+        async def flaky_poll(token):
+            polls.append(token)
+            if len(polls) < 3:
+                raise ConnectionError("Connection refused")
+            engine.stop()
+
+        engine._poll = flaky_poll
+        await engine._slot(0)
+
+    asyncio.run(scenario())
+    assert len(polls) == 3